@@ -0,0 +1,155 @@
+import argparse
+import bisect
+import itertools
+import random
+import time
+import tracemalloc
+
+from lru_cache import FrequencyCacheV2
+from lru_cache2 import (
+    ApproximateFrequencyCache,
+    BucketFrequencyCache,
+    ConcurrentFrequencyCache,
+    FrequencyCache,
+)
+
+"""
+Replays a key trace through every frequency cache variant and reports, per
+capacity: ops/sec, p50/p99 latency of a single addKey, retained memory and
+hit ratio (the fraction of addKey calls whose key was already tracked).
+
+    python cache_bench.py                            # Zipf trace
+    python cache_bench.py --trace keys.txt           # one key per line
+    python cache_bench.py --ops 200000 --capacities 100,10000 --variants bucket,heap
+
+lru_cache.FrequencyCache is not included: it is the unfinished first draft
+(its constructor is misnamed). FrequencyCacheV2 has no capacity, so it keeps
+every key; it is replayed once and its capacity shows as "unbounded". Its
+O(n) heapify per increment makes it slow on large traces.
+ConcurrentFrequencyCache buffers increments, so its hit ratio is not
+observable per call; it is replayed from a single thread.
+"""
+
+
+def zipf_trace(num_ops, num_keys, alpha=1.0, seed=0) -> list:
+    """`num_ops` keys drawn from a Zipf(alpha) distribution over `num_keys` keys."""
+    rng = random.Random(seed)
+    weights = [1.0 / (rank ** alpha) for rank in range(1, num_keys + 1)]
+    cum_weights = list(itertools.accumulate(weights))
+    # Shuffle names so that popularity is not correlated with key order.
+    names = [f"key{i}" for i in range(num_keys)]
+    rng.shuffle(names)
+    return [names[i] for i in (bisect.bisect(cum_weights, rng.random() * cum_weights[-1])
+                               for _ in range(num_ops))]
+
+
+def load_trace(path) -> list:
+    """Loads a trace file with one key per line, skipping blank lines."""
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+# name -> (factory(capacity), contains(cache, key) or None if not observable)
+# Variants in UNBOUNDED ignore the capacity; they are replayed once.
+VARIANTS = {
+    "heap-v2": (lambda capacity: FrequencyCacheV2(), lambda cache, key: key in cache.items),
+    "heap": (lambda capacity: FrequencyCache(capacity), lambda cache, key: key in cache.items),
+    "bucket": (lambda capacity: BucketFrequencyCache(capacity), lambda cache, key: key in cache.buckets),
+    "approx": (lambda capacity: ApproximateFrequencyCache(heavy_hitters=capacity),
+               lambda cache, key: key in cache.top.buckets),
+    "concurrent": (lambda capacity: ConcurrentFrequencyCache(capacity=capacity), None),
+}
+UNBOUNDED = {"heap-v2"}
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(p / 100.0 * len(sorted_values)))]
+
+
+def replay(name, capacity, trace) -> dict:
+    factory, contains = VARIANTS[name]
+
+    # Pass 1: throughput of addKey alone, without tracemalloc's overhead.
+    cache = factory(capacity)
+    clock = time.perf_counter_ns
+    started = clock()
+    for key in trace:
+        cache.addKey(key)
+    elapsed = (clock() - started) / 1e9
+
+    # Pass 2: per-call latency and hit ratio.
+    cache = factory(capacity)
+    latencies = []
+    hits = 0
+    for key in trace:
+        if contains is not None and contains(cache, key):
+            hits += 1
+        t0 = clock()
+        cache.addKey(key)
+        latencies.append(clock() - t0)
+    latencies.sort()
+
+    # Pass 3: memory retained by the cache after the replay.
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    cache = factory(capacity)
+    for key in trace:
+        cache.addKey(key)
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    return {
+        "variant": name,
+        "capacity": None if name in UNBOUNDED else capacity,
+        "ops_per_sec": len(trace) / elapsed if elapsed else 0.0,
+        "p50_us": percentile(latencies, 50) / 1000,
+        "p99_us": percentile(latencies, 99) / 1000,
+        "memory_kib": retained / 1024,
+        "hit_ratio": hits / len(trace) if contains is not None and trace else None,
+    }
+
+
+def format_row(result) -> str:
+    hit_ratio = "-" if result["hit_ratio"] is None else f"{result['hit_ratio']:.3f}"
+    capacity = "unbounded" if result["capacity"] is None else result["capacity"]
+    return (f"{result['variant']:<12}{capacity:>10}{result['ops_per_sec']:>14,.0f}"
+            f"{result['p50_us']:>10.2f}{result['p99_us']:>10.2f}{result['memory_kib']:>12,.0f}{hit_ratio:>10}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a key trace through the frequency caches.")
+    parser.add_argument("--trace", help="trace file with one key per line (default: a Zipf trace)")
+    parser.add_argument("--ops", type=int, default=20000, help="Zipf trace length")
+    parser.add_argument("--keys", type=int, default=5000, help="distinct keys in the Zipf trace")
+    parser.add_argument("--alpha", type=float, default=1.0, help="Zipf skew")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--capacities", default="100,1000",
+                        help="comma-separated capacities to test")
+    parser.add_argument("--variants", default=",".join(VARIANTS),
+                        help=f"comma-separated subset of {','.join(VARIANTS)}")
+    args = parser.parse_args(argv)
+
+    trace = load_trace(args.trace) if args.trace else zipf_trace(args.ops, args.keys, args.alpha, args.seed)
+    capacities = [int(c) for c in args.capacities.split(",")]
+    variants = args.variants.split(",")
+    for name in variants:
+        if name not in VARIANTS:
+            parser.error(f"unknown variant {name!r}")
+
+    print(f"{len(trace):,} ops, {len(set(trace)):,} distinct keys")
+    print(f"{'variant':<12}{'capacity':>10}{'ops/sec':>14}{'p50 us':>10}{'p99 us':>10}{'mem KiB':>12}{'hit':>10}")
+    results = []
+    for n, capacity in enumerate(capacities):
+        for name in variants:
+            if name in UNBOUNDED and n > 0:
+                continue
+            result = replay(name, capacity, trace)
+            results.append(result)
+            print(format_row(result))
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import asyncio
+
+from kv_cache import ShardedTimeMap
+
+"""
+An asyncio facade over ShardedTimeMap.
+
+Services that fan out reads typically await many `get`s at once. Instead of
+taking a shard lock per key, AsyncTimeMap collects every `get` issued during
+the same event-loop iteration and resolves them together on the next one with
+ShardedTimeMap.get_many, i.e. with one lock acquisition per shard.
+"""
+
+
+class AsyncTimeMap:
+    def __init__(self, time_map: ShardedTimeMap = None):
+        self.time_map = time_map if time_map is not None else ShardedTimeMap()
+        self._pending = []  # [(key, timestamp, future)] waiting for the next flush
+        self._flush_scheduled = False
+        self.flushes = 0  # number of batches resolved, for observability
+
+    def get(self, key: str, timestamp: int) -> asyncio.Future:
+        """
+        Returns an awaitable for the value of `key` at `timestamp`.
+        It is resolved in a batch with all other gets issued in the same tick.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((key, timestamp, future))
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            loop.call_soon(self._flush)
+        return future
+
+    async def mget(self, items) -> list:
+        """Looks up many (key, timestamp) pairs; they join the current batch."""
+        return await asyncio.gather(*(self.get(key, timestamp) for key, timestamp in items))
+
+    async def set(self, key: str, value: str, timestamp: int) -> None:
+        # Writes take the shard write lock briefly and never wait on I/O,
+        # so they run inline rather than being deferred.
+        self.time_map.set(key, value, timestamp)
+
+    def _flush(self) -> None:
+        pending, self._pending = self._pending, []
+        self._flush_scheduled = False
+        live = [(key, timestamp, future) for key, timestamp, future in pending if not future.cancelled()]
+        if not live:
+            return
+        self.flushes += 1
+        try:
+            values = self.time_map.get_many([(key, timestamp) for key, timestamp, _ in live])
+        except Exception as e:
+            for _, _, future in live:
+                future.set_exception(e)
+            return
+        for (_, _, future), value in zip(live, values):
+            future.set_result(value)
+
+
+if __name__ == "__main__":
+    async def main():
+        store = AsyncTimeMap(ShardedTimeMap(num_shards=4))
+        await store.set("foo", "bar", 1)
+        assert await store.get("foo", 1) == "bar"
+        assert await store.get("foo", 0) == ""
+
+        for i in range(200):
+            await store.set(f"k{i}", f"v{i}", i)
+        flushes = store.flushes
+        values = await asyncio.gather(*(store.get(f"k{i}", i) for i in range(200)))
+        assert values == [f"v{i}" for i in range(200)]
+        # 200 concurrent gets were resolved in a single batch.
+        assert store.flushes == flushes + 1
+
+        assert await store.mget([("k1", 1), ("k2", 1), ("nope", 5)]) == ["v1", "", ""]
+
+        async def fan_out(n):
+            return await store.get(f"k{n}", 10**6)
+
+        assert await asyncio.gather(*(fan_out(n) for n in range(50))) == [f"v{n}" for n in range(50)]
+        print("AsyncTimeMap Passed!")
+
+    asyncio.run(main())
@@ -1,5 +1,8 @@
 import bisect
-from collections import defaultdict
+import hashlib
+import heapq
+from collections import defaultdict, deque
+from contextlib import contextmanager
 import threading
 import time
 
@@ -120,6 +123,205 @@ class ReadWriteLock:
             self._writers = 0
             self._condition.notify_all()
 
+
+class LatencyHistogram:
+    """
+    A fixed-bucket histogram of durations (in seconds).
+    Bucket i counts samples below 2**i microseconds, so recording is O(1)
+    and the memory footprint does not grow with the number of samples.
+    Not synchronized on its own; the owning lock records under its mutex.
+    """
+    NUM_BUCKETS = 32  # 2**31 us ~ 36 minutes; anything slower lands in the last bucket.
+
+    def __init__(self):
+        self.buckets = [0] * self.NUM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        micros = int(seconds * 1_000_000)
+        i = min(micros.bit_length(), self.NUM_BUCKETS - 1)
+        self.buckets[i] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, p: float) -> float:
+        """
+        Returns an upper bound (in seconds) for the p-th percentile,
+        i.e. the upper edge of the bucket that contains it.
+        """
+        if self.count == 0:
+            return 0.0
+        rank = max(1, int(round(p / 100.0 * self.count)))
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return min((1 << i) / 1_000_000, self.max)
+        return self.max
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.mean(),
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class LockStats:
+    """Wait-time and hold-time histograms for the read and write side of a lock."""
+    def __init__(self):
+        self.read_wait = LatencyHistogram()
+        self.write_wait = LatencyHistogram()
+        self.read_hold = LatencyHistogram()
+        self.write_hold = LatencyHistogram()
+        self.timeouts = 0
+
+    def snapshot(self) -> dict:
+        return {
+            "read_wait": self.read_wait.snapshot(),
+            "write_wait": self.write_wait.snapshot(),
+            "read_hold": self.read_hold.snapshot(),
+            "write_hold": self.write_hold.snapshot(),
+            "timeouts": self.timeouts,
+        }
+
+
+class FairReadWriteLock:
+    """
+    A fair read-write lock with writer preference.
+
+    `ReadWriteLock` above lets new readers in as long as no writer *holds* the
+    lock, so a steady stream of readers starves writers forever. Here every
+    thread that cannot enter immediately joins a FIFO queue:
+    - A reader enters at once only if no writer is active and nobody is queued,
+      so a waiting writer blocks all readers that arrive after it.
+    - Waiters are admitted strictly in arrival order; a run of consecutive
+      readers at the head of the queue is admitted together.
+    Neither side can starve the other.
+
+    acquire_read/acquire_write take an optional timeout and return False if it
+    expires. read_locked()/write_locked() are context managers that raise
+    TimeoutError instead.
+
+    A read lock belongs to the thread that acquired it, as with
+    threading.RLock: that thread must release it, since read hold times are
+    kept per thread. Releasing from a thread that holds no read lock raises
+    RuntimeError. A thread holding several read locks releases them last in,
+    first out.
+    """
+    _READ = "r"
+    _WRITE = "w"
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._queue = deque()  # tickets of waiting threads, in arrival order
+        self._local = threading.local()  # per-thread read acquire times, for hold stats
+        self._write_acquired_at = 0.0
+        self.stats = LockStats()
+
+    def _can_enter(self, kind) -> bool:
+        if kind == self._WRITE:
+            return not self._writer and self._readers == 0
+        return not self._writer
+
+    def _enter(self, kind, start):
+        """Takes ownership for `kind`. Must be called with the mutex held."""
+        now = time.perf_counter()
+        if kind == self._WRITE:
+            self._writer = True
+            self._write_acquired_at = now
+            self.stats.write_wait.record(now - start)
+        else:
+            self._readers += 1
+            self.stats.read_wait.record(now - start)
+        return now
+
+    def _acquire(self, kind, timeout):
+        """Returns the acquire time, or None if the timeout expired."""
+        start = time.perf_counter()
+        with self._cond:
+            if not self._queue and self._can_enter(kind):
+                return self._enter(kind, start)
+
+            ticket = object()  # compared by identity only
+            self._queue.append(ticket)
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while not (self._queue[0] is ticket and self._can_enter(kind)):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._queue.remove(ticket)
+                    self.stats.timeouts += 1
+                    # The head of the queue may have changed; let it re-check.
+                    self._cond.notify_all()
+                    return None
+                self._cond.wait(remaining)
+
+            self._queue.popleft()
+            if kind == self._READ and self._queue:
+                # Let the next reader in the run (if any) follow us in.
+                self._cond.notify_all()
+            return self._enter(kind, start)
+
+    def acquire_read(self, timeout=None) -> bool:
+        acquired_at = self._acquire(self._READ, timeout)
+        if acquired_at is None:
+            return False
+        held = getattr(self._local, "held", None)
+        if held is None:
+            held = self._local.held = []
+        held.append(acquired_at)
+        return True
+
+    def release_read(self):
+        held = getattr(self._local, "held", None)
+        if not held:
+            raise RuntimeError("cannot release a read lock this thread does not hold")
+        acquired_at = held.pop()
+        with self._cond:
+            self._readers -= 1
+            self.stats.read_hold.record(time.perf_counter() - acquired_at)
+            if self._readers == 0:
+                self._cond.notify_all()
+
+    def acquire_write(self, timeout=None) -> bool:
+        return self._acquire(self._WRITE, timeout) is not None
+
+    def release_write(self):
+        with self._cond:
+            self._writer = False
+            self.stats.write_hold.record(time.perf_counter() - self._write_acquired_at)
+            self._cond.notify_all()
+
+    @contextmanager
+    def read_locked(self, timeout=None):
+        if not self.acquire_read(timeout):
+            raise TimeoutError("timed out waiting for read lock")
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write_locked(self, timeout=None):
+        if not self.acquire_write(timeout):
+            raise TimeoutError("timed out waiting for write lock")
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
 rwlock = ReadWriteLock()
 data = ()
 
@@ -138,59 +340,455 @@ def writer(value):
         rwlock.release_write()
 
 
+def stable_hash(key) -> int:
+    """
+    A 64-bit hash of `key` that is identical across processes and runs.
+    The builtin hash() of a str is salted per process (PYTHONHASHSEED), so it
+    cannot be used to agree on key placement between processes.
+    """
+    data = key if isinstance(key, bytes) else key.encode()
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    An immutable consistent-hash ring with virtual nodes.
+
+    Every shard id is placed on the ring at `vnodes` pseudo-random points; a key
+    belongs to the first point clockwise from its hash. Adding a shard only
+    takes over the arcs in front of its own points, so on average only
+    1 / (num_shards + 1) of the keys move, instead of nearly all of them with
+    `hash(key) % num_shards`.
+    """
+    def __init__(self, shard_ids=(), vnodes: int = 64):
+        self.shard_ids = list(shard_ids)
+        self.vnodes = vnodes
+        points = sorted(
+            (stable_hash(f"shard-{shard_id}#{v}"), shard_id)
+            for shard_id in self.shard_ids
+            for v in range(vnodes)
+        )
+        self._points = [p for p, _ in points]
+        self._owners = [shard_id for _, shard_id in points]
+
+    def with_shard(self, shard_id) -> 'HashRing':
+        """Returns a new ring that also contains `shard_id`."""
+        return HashRing(self.shard_ids + [shard_id], self.vnodes)
+
+    def lookup(self, h: int):
+        """Returns the shard id owning hash `h`. O(log(num_shards * vnodes))."""
+        i = bisect.bisect_right(self._points, h)
+        if i == len(self._points):
+            i = 0
+        return self._owners[i]
+
+
 class ShardedTimeMap:
     """
     A thread-safe, sharded implementation of the TimeMap.
-    It distributes keys across a fixed number of shards, each with its own
-    ReadWriteLock, to allow for high concurrency.
+    It distributes keys across shards with a consistent-hash ring, each shard with
+    its own FairReadWriteLock, to allow for high concurrency without starving
+    writers. Shards can be added online with `add_shard`.
     """
     class _Shard:
         def __init__(self):
             self.data = defaultdict(list)
-            self.lock = ReadWriteLock()
+            self.lock = FairReadWriteLock()
 
         def set(self, key: str, value: str, timestamp: int):
-            self.lock.acquire_write()
-            try:
+            with self.lock.write_locked():
                 # bisect.insort is needed here if timestamps are not guaranteed to be sequential per key
                 self.data[key].append((timestamp, value))
-            finally:
-                self.lock.release_write()
 
         def get(self, key: str, timestamp: int) -> str:
-            self.lock.acquire_read()
-            try:
+            entry = self.get_entry(key, timestamp)
+            return entry[1] if entry else ""
+
+        def get_entry(self, key: str, timestamp: int):
+            """Returns the latest (timestamp, value) at or before `timestamp`, or None."""
+            with self.lock.read_locked():
                 if key not in self.data:
-                    return ""
+                    return None
 
                 values = self.data[key]
                 i = bisect.bisect_right(values, (timestamp, "{"))
                 if i == 0:
-                    return ""
-                return values[i - 1][1]
-            finally:
-                self.lock.release_read()
+                    return None
+                return values[i - 1]
+
+        def get_many(self, items) -> list:
+            """Looks up many (key, timestamp) pairs under a single read lock acquisition."""
+            results = []
+            with self.lock.read_locked():
+                for key, timestamp in items:
+                    values = self.data.get(key)
+                    i = bisect.bisect_right(values, (timestamp, "{")) if values else 0
+                    results.append(values[i - 1][1] if i else "")
+            return results
+
+    class _LockFreeShard:
+        """
+        A shard whose readers never take a lock.
+
+        Each key maps to a list of (timestamp, value) pairs that is only ever
+        appended to once published: entries below the length a reader observes
+        never change, so `bisect_right` over it is safe without a lock (list
+        append and dict lookups are atomic in CPython and internally locked on
+        free-threaded builds). An out-of-order timestamp cannot be appended in
+        place, so the writer copies the list, inserts into the copy and swaps
+        the dict entry; readers still holding the old list see a consistent
+        older version. Writers are serialized by the shard lock.
+        """
+        def __init__(self):
+            self.data = {}
+            self.lock = FairReadWriteLock()
 
-    def __init__(self, num_shards: int = 16):
+        def set(self, key: str, value: str, timestamp: int):
+            with self.lock.write_locked():
+                values = self.data.get(key)
+                if values is None:
+                    self.data[key] = [(timestamp, value)]
+                elif values[-1][0] <= timestamp:
+                    values.append((timestamp, value))
+                else:
+                    # Copy-on-write: never reorder a list readers may be scanning.
+                    values = list(values)
+                    bisect.insort(values, (timestamp, value))
+                    self.data[key] = values
+
+        def get(self, key: str, timestamp: int) -> str:
+            entry = self.get_entry(key, timestamp)
+            return entry[1] if entry else ""
+
+        def get_entry(self, key: str, timestamp: int):
+            """Returns the latest (timestamp, value) at or before `timestamp`, or None."""
+            values = self.data.get(key)
+            if values is None:
+                return None
+            i = bisect.bisect_right(values, (timestamp, "{"))
+            if i == 0:
+                return None
+            return values[i - 1]
+
+        def get_many(self, items) -> list:
+            return [self.get(key, timestamp) for key, timestamp in items]
+
+    def __init__(self, num_shards: int = 16, lock_free_reads: bool = False, vnodes: int = 64):
         """
         Initializes the sharded map.
 
         Args:
-            num_shards: The number of shards to partition the key space into.
+            num_shards: The initial number of shards to partition the key space into.
                         A higher number can increase concurrency but also memory overhead.
-                        Should be a power of 2 for efficient hashing.
+                        More shards can be added later with `add_shard`.
+            lock_free_reads: If True, `get` never takes a lock (see _LockFreeShard).
+                        Writes are still serialized per shard.
+            vnodes: Virtual nodes per shard on the consistent-hash ring.
         """
-        self.shards = [self._Shard() for _ in range(num_shards)]
+        self._shard_cls = self._LockFreeShard if lock_free_reads else self._Shard
+        self.shards = [self._shard_cls() for _ in range(num_shards)]
         self.num_shards = num_shards
+        # (current ring, previous ring while a migration is in progress else None).
+        # Swapped as a single tuple so readers always see a consistent pair.
+        self._routing = (HashRing(range(num_shards), vnodes), None)
+        # Writers hold the read side; add_shard takes the write side to drain
+        # in-flight writes before switching rings.
+        self._write_gate = FairReadWriteLock()
+        self._reshard_lock = threading.Lock()
 
     def _get_shard(self, key: str) -> '_Shard':
         """
-        Determines which shard a key belongs to using its hash.
+        Determines which shard a key belongs to using a stable hash and the ring.
         """
-        return self.shards[hash(key) % self.num_shards]
+        return self.shards[self._routing[0].lookup(stable_hash(key))]
 
     def set(self, key: str, value: str, timestamp: int) -> None:
-        self._get_shard(key).set(key, value, timestamp)
+        with self._write_gate.read_locked():
+            self._get_shard(key).set(key, value, timestamp)
 
     def get(self, key: str, timestamp: int) -> str:
-        return self._get_shard(key).get(key, timestamp)
\ No newline at end of file
+        while True:
+            routing = self._routing
+            entry = self._get_entry(routing, key, timestamp)
+            if entry is not None:
+                return entry[1]
+            # A miss under a stale routing may only mean add_shard moved the key
+            # away after we read it. The ring switch always happens before any key
+            # is deleted, so an unchanged routing makes the miss authoritative.
+            if self._routing is routing:
+                return ""
+
+    def _get_entry(self, routing, key: str, timestamp: int):
+        ring, previous = routing
+        h = stable_hash(key)
+        shard = self.shards[ring.lookup(h)]
+        if previous is None:
+            return shard.get_entry(key, timestamp)
+
+        old_shard = self.shards[previous.lookup(h)]
+        if old_shard is shard:
+            return shard.get_entry(key, timestamp)
+        # Mid-migration the key's versions may be split between its old and new
+        # owner. Check the old owner first: a key moved after that check is
+        # already in the new owner by the time we look there.
+        old_entry = old_shard.get_entry(key, timestamp)
+        new_entry = shard.get_entry(key, timestamp)
+        if old_entry is None or (new_entry is not None and new_entry[0] >= old_entry[0]):
+            return new_entry
+        return old_entry
+
+    def get_many(self, items) -> list:
+        """
+        Looks up many (key, timestamp) pairs, grouped so that each shard is
+        locked once per call instead of once per key. Results are in input order.
+        """
+        routing = self._routing
+        ring, previous = routing
+        if previous is not None:
+            # Keys may be split between two shards mid-migration.
+            return [self.get(key, timestamp) for key, timestamp in items]
+
+        batches = defaultdict(list)  # shard id -> [(position, (key, timestamp))]
+        for position, item in enumerate(items):
+            batches[ring.lookup(stable_hash(item[0]))].append((position, item))
+
+        results = [""] * len(items)
+        for shard_id, batch in batches.items():
+            values = self.shards[shard_id].get_many([item for _, item in batch])
+            for (position, _), value in zip(batch, values):
+                results[position] = value
+        if self._routing is not routing:
+            # As in get: misses read under a since-replaced ring are retried.
+            for position, (key, timestamp) in enumerate(items):
+                if results[position] == "":
+                    results[position] = self.get(key, timestamp)
+        return results
+
+    def add_shard(self) -> int:
+        """
+        Adds one shard online and returns its id.
+
+        Only keys whose ring position now belongs to the new shard are moved,
+        one key at a time, while gets and sets keep being served.
+        """
+        with self._reshard_lock:
+            old_ring = self._routing[0]
+            new_id = len(self.shards)
+            self.shards.append(self._shard_cls())
+            new_ring = old_ring.with_shard(new_id)
+            with self._write_gate.write_locked():
+                self._routing = (new_ring, old_ring)
+                self.num_shards = len(self.shards)
+
+            dst = self.shards[new_id]
+            for src in self.shards[:new_id]:
+                self._migrate(src, dst, new_ring, new_id)
+            self._routing = (new_ring, None)
+            return new_id
+
+    @staticmethod
+    def _migrate(src, dst, ring: HashRing, dst_id: int) -> None:
+        """Moves the keys of `src` that `ring` assigns to `dst_id` into `dst`."""
+        with src.lock.write_locked():
+            keys = [key for key in src.data if ring.lookup(stable_hash(key)) == dst_id]
+
+        for key in keys:
+            with src.lock.write_locked(), dst.lock.write_locked():
+                moved = src.data.get(key)
+                if moved is None:
+                    continue
+                # Versions written to dst since the ring switched are merged in;
+                # publish into dst before removing from src so readers never miss it.
+                current = dst.data.get(key)
+                dst.data[key] = list(heapq.merge(moved, current)) if current else moved
+                del src.data[key]
+
+    def lock_stats(self) -> list:
+        """Returns a LockStats snapshot per shard, to spot contended shards."""
+        return [shard.lock.stats.snapshot() for shard in self.shards]
+
+
+if __name__ == "__main__":
+    tm = TimeMap()
+    tm.set("foo", "bar", 1)
+    assert tm.get("foo", 1) == "bar"
+    assert tm.get("foo", 3) == "bar"
+    tm.set("foo", "bar2", 4)
+    assert tm.get("foo", 4) == "bar2"
+    assert tm.get("foo", 0) == ""
+    print("TimeMap Passed!")
+
+    # A writer queued behind an active reader blocks readers that arrive later.
+    lock = FairReadWriteLock()
+    order = []
+    assert lock.acquire_read()
+
+    def queued_writer():
+        with lock.write_locked():
+            order.append("w")
+
+    def late_reader():
+        with lock.read_locked():
+            order.append("r")
+
+    w = threading.Thread(target=queued_writer)
+    w.start()
+    while not lock._queue:
+        time.sleep(0.001)
+    r = threading.Thread(target=late_reader)
+    r.start()
+    while len(lock._queue) < 2:
+        time.sleep(0.001)
+    assert not lock.acquire_write(timeout=0.01)
+    lock.release_read()
+    w.join()
+    r.join()
+    assert order == ["w", "r"], order
+    assert lock.stats.timeouts == 1
+    assert lock.stats.write_wait.count == 1
+
+    # A read lock can only be released by the thread holding it.
+    assert lock.acquire_read()
+    errors = []
+
+    def foreign_release():
+        try:
+            lock.release_read()
+        except RuntimeError as e:
+            errors.append(e)
+
+    t = threading.Thread(target=foreign_release)
+    t.start()
+    t.join()
+    assert len(errors) == 1 and lock._readers == 1
+    lock.release_read()
+    assert lock._readers == 0 and lock.acquire_write(timeout=1)
+    lock.release_write()
+    print("FairReadWriteLock Passed!")
+
+    sharded = ShardedTimeMap(num_shards=4)
+
+    def worker(n):
+        for t in range(200):
+            sharded.set(f"k{n}", str(t), t)
+            assert sharded.get(f"k{n}", t) == str(t)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sharded.get("k3", 150) == "150"
+    assert sum(s["write_hold"]["count"] for s in sharded.lock_stats()) == 8 * 200
+    print("ShardedTimeMap Passed!")
+
+    lock_free = ShardedTimeMap(num_shards=4, lock_free_reads=True)
+    lock_free.set("foo", "bar", 1)
+    lock_free.set("foo", "bar4", 4)
+    lock_free.set("foo", "bar2", 2)  # out of order: copy-on-write path
+    assert lock_free.get("foo", 3) == "bar2"
+    assert lock_free.get("foo", 5) == "bar4"
+    assert lock_free.get("foo", 0) == ""
+    assert lock_free.get("missing", 5) == ""
+
+    def lock_free_writer():
+        for t in range(1, 2001):
+            lock_free.set("hot", str(t), t)
+
+    def lock_free_reader():
+        last = 0
+        while last < 2000:
+            got = lock_free.get("hot", 10**9)
+            # Readers never see a torn list or go back in time.
+            last_seen = int(got) if got else 0
+            assert last_seen >= last
+            last = last_seen
+
+    threads = [threading.Thread(target=lock_free_writer)]
+    threads += [threading.Thread(target=lock_free_reader) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert all(s["read_wait"]["count"] == 0 for s in lock_free.lock_stats())
+    print("Lock-free ShardedTimeMap Passed!")
+
+    assert stable_hash("foo") == int.from_bytes(hashlib.blake2b(b"foo", digest_size=8).digest(), "big")
+    for lock_free_reads in (False, True):
+        resharded = ShardedTimeMap(num_shards=4, lock_free_reads=lock_free_reads)
+        keys = [f"user{i}" for i in range(2000)]
+        for i, key in enumerate(keys):
+            resharded.set(key, "v1", 1)
+        owners = {key: resharded._get_shard(key) for key in keys}
+
+        new_id = resharded.add_shard()
+        assert resharded.num_shards == 5
+        moved = [key for key in keys if resharded._get_shard(key) is not owners[key]]
+        # Only keys now owned by the new shard move, roughly 1/5 of them.
+        assert all(resharded._get_shard(key) is resharded.shards[new_id] for key in moved)
+        assert 0 < len(moved) < len(keys) // 2
+        for key in keys:
+            assert resharded.get(key, 1) == "v1"
+            resharded.set(key, "v2", 2)
+            assert resharded.get(key, 1) == "v1"
+            assert resharded.get(key, 2) == "v2"
+
+    # Resharding under concurrent traffic loses no writes.
+    live = ShardedTimeMap(num_shards=2)
+    stop = threading.Event()
+    written = {}
+
+    def live_writer(n):
+        t = 0
+        while not stop.is_set():
+            t += 1
+            live.set(f"w{n}-{t % 50}", str(t), t)
+            written[n] = t
+
+    threads = [threading.Thread(target=live_writer, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for _ in range(3):
+        live.add_shard()
+    stop.set()
+    for t in threads:
+        t.join()
+    for n, last in written.items():
+        assert live.get(f"w{n}-{last % 50}", last) == str(last)
+
+    # A reader that picked its shard just before add_shard still finds keys
+    # migrated away before it got to look.
+    for read in ("get", "get_many"):
+        racy = ShardedTimeMap(num_shards=2)
+        racy_keys = [f"r{i}" for i in range(200)]
+        for key in racy_keys:
+            racy.set(key, "v", 1)
+        future = ShardedTimeMap(num_shards=2)
+        future.add_shard()
+        mover = next(key for key in racy_keys if future._get_shard(key) is future.shards[2])
+        stale_shard = racy._get_shard(mover)
+
+        def reshard_first(lookup):
+            def wrapped(*args):
+                del stale_shard.get_entry, stale_shard.get_many
+                racy.add_shard()
+                return lookup(*args)
+            return wrapped
+
+        stale_shard.get_entry = reshard_first(stale_shard.get_entry)
+        stale_shard.get_many = reshard_first(stale_shard.get_many)
+        if read == "get":
+            assert racy.get(mover, 1) == "v"
+        else:
+            assert racy.get_many([(mover, 1)]) == ["v"]
+        assert racy.num_shards == 3
+    print("Consistent-hash resharding Passed!")
+
+    batched = ShardedTimeMap(num_shards=4)
+    for i in range(100):
+        batched.set(f"b{i}", f"v{i}", i)
+    assert batched.get_many([(f"b{i}", i) for i in range(100)]) == [f"v{i}" for i in range(100)]
+    assert batched.get_many([("b1", 0), ("nope", 1)]) == ["", ""]
+    # One read lock acquisition per shard per call (two calls), not one per key.
+    assert sum(s["read_wait"]["count"] for s in batched.lock_stats()) <= 2 * batched.num_shards
+    print("ShardedTimeMap.get_many Passed!")
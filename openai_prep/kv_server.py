@@ -0,0 +1,385 @@
+import multiprocessing
+import os
+import socket
+import socketserver
+import struct
+
+from kv_cache import HashRing, ShardedTimeMap, stable_hash
+
+"""
+A multi-process ShardedTimeMap.
+
+Each shard lives in its own worker process and serves a compact binary protocol
+over a Unix-domain socket, so reads and writes on different shards run on
+different cores instead of sharing one GIL. TimeMapClient mirrors the
+TimeMap set/get API and routes keys with the same consistent-hash ring as
+ShardedTimeMap (stable_hash is identical in every process).
+
+Wire format (network byte order). Every request and response is one frame:
+
+    header:   op (B), payload length (I)
+    payload:  item count (I), then the items
+
+    SET item: key length (H), key, value length (I), value, timestamp (q)
+    GET item: key length (H), key, timestamp (q)
+
+    SET reply payload: item count (I)
+    GET reply payload: item count (I), then per item value length (I), value
+
+A single set/get is a batch of one. Replies come back in request order on each
+connection, so a client may write many frames before reading any reply
+(pipelining).
+"""
+
+OP_SET = 1
+OP_GET = 2
+
+_HEADER = struct.Struct("!BI")
+_COUNT = struct.Struct("!I")
+_KEY_LEN = struct.Struct("!H")
+_VALUE_LEN = struct.Struct("!I")
+_TIMESTAMP = struct.Struct("!q")
+
+
+def _encode_frame(op: int, items) -> bytes:
+    """Encodes a batch of (key, value, timestamp) for SET or (key, timestamp) for GET."""
+    payload = bytearray(_COUNT.pack(len(items)))
+    for item in items:
+        key = item[0].encode()
+        payload += _KEY_LEN.pack(len(key))
+        payload += key
+        if op == OP_SET:
+            value = item[1].encode()
+            payload += _VALUE_LEN.pack(len(value))
+            payload += value
+        payload += _TIMESTAMP.pack(item[-1])
+    return _HEADER.pack(op, len(payload)) + payload
+
+
+def _decode_items(op: int, payload: bytes) -> list:
+    (count,) = _COUNT.unpack_from(payload, 0)
+    offset = _COUNT.size
+    items = []
+    for _ in range(count):
+        (key_len,) = _KEY_LEN.unpack_from(payload, offset)
+        offset += _KEY_LEN.size
+        key = payload[offset:offset + key_len].decode()
+        offset += key_len
+        if op == OP_SET:
+            (value_len,) = _VALUE_LEN.unpack_from(payload, offset)
+            offset += _VALUE_LEN.size
+            value = payload[offset:offset + value_len].decode()
+            offset += value_len
+        (timestamp,) = _TIMESTAMP.unpack_from(payload, offset)
+        offset += _TIMESTAMP.size
+        items.append((key, value, timestamp) if op == OP_SET else (key, timestamp))
+    return items
+
+
+def _encode_values(values) -> bytes:
+    payload = bytearray(_COUNT.pack(len(values)))
+    for value in values:
+        data = value.encode()
+        payload += _VALUE_LEN.pack(len(data))
+        payload += data
+    return payload
+
+
+def _decode_values(payload: bytes) -> list:
+    (count,) = _COUNT.unpack_from(payload, 0)
+    offset = _COUNT.size
+    values = []
+    for _ in range(count):
+        (value_len,) = _VALUE_LEN.unpack_from(payload, offset)
+        offset += _VALUE_LEN.size
+        values.append(payload[offset:offset + value_len].decode())
+        offset += value_len
+    return values
+
+
+def _read_frame(rfile):
+    """Returns (op, payload), or None on a clean EOF between frames."""
+    header = rfile.read(_HEADER.size)
+    if not header:
+        return None
+    if len(header) < _HEADER.size:
+        raise ConnectionError("connection closed mid-frame")
+    op, length = _HEADER.unpack(header)
+    payload = rfile.read(length)
+    if len(payload) < length:
+        raise ConnectionError("connection closed mid-frame")
+    return op, payload
+
+
+# ======================================================================================
+# Server: one process per shard
+# ======================================================================================
+
+class _ShardRequestHandler(socketserver.StreamRequestHandler):
+    """Serves frames from one client connection until it disconnects."""
+
+    def handle(self):
+        shard = self.server.shard
+        while True:
+            frame = _read_frame(self.rfile)
+            if frame is None:
+                return
+            op, payload = frame
+            if op not in (OP_SET, OP_GET):
+                # The protocol has no error reply: hang up without parsing the payload.
+                return
+            try:
+                items = _decode_items(op, payload)
+            except (struct.error, UnicodeDecodeError):
+                return
+            if op == OP_SET:
+                for key, value, timestamp in items:
+                    shard.set(key, value, timestamp)
+                reply = _COUNT.pack(len(items))
+            else:
+                reply = _encode_values([shard.get(key, timestamp) for key, timestamp in items])
+            self.wfile.write(_HEADER.pack(op, len(reply)) + reply)
+
+
+class _ShardServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path):
+        super().__init__(path, _ShardRequestHandler)
+        # Each connection gets a thread; readers of this shard never block on a lock.
+        self.shard = ShardedTimeMap._LockFreeShard()
+
+
+def _serve_shard(path: str, ready) -> None:
+    """Worker process entry point: serves one shard on `path` until terminated."""
+    if os.path.exists(path):
+        os.unlink(path)
+    with _ShardServer(path) as server:
+        ready.set()
+        server.serve_forever()
+
+
+class TimeMapServer:
+    """
+    Starts one worker process per shard, each listening on
+    `<socket_dir>/shard-<i>.sock`. Use as a context manager or call
+    start()/stop().
+    """
+    def __init__(self, socket_dir: str, num_shards: int = 4):
+        self.socket_dir = socket_dir
+        self.num_shards = num_shards
+        self.processes = []
+
+    def socket_paths(self) -> list:
+        return [os.path.join(self.socket_dir, f"shard-{i}.sock") for i in range(self.num_shards)]
+
+    def start(self, timeout: float = 10.0) -> None:
+        os.makedirs(self.socket_dir, exist_ok=True)
+        events = []
+        for path in self.socket_paths():
+            ready = multiprocessing.Event()
+            process = multiprocessing.Process(target=_serve_shard, args=(path, ready), daemon=True)
+            process.start()
+            self.processes.append(process)
+            events.append(ready)
+        for ready in events:
+            if not ready.wait(timeout):
+                self.stop()
+                raise TimeoutError("shard worker did not start in time")
+
+    def stop(self) -> None:
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join()
+        self.processes = []
+        for path in self.socket_paths():
+            if os.path.exists(path):
+                os.unlink(path)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+# ======================================================================================
+# Client
+# ======================================================================================
+
+class Pipeline:
+    """
+    Buffers set/get calls and sends them with as few frames as possible:
+    consecutive operations of the same kind for the same shard are coalesced
+    into one batch frame. Frames are written to every shard before any reply
+    is read, so the shard processes work in parallel.
+    Results of execute() are in call order: None for a set, the value for a get.
+
+    Alternating sets and gets on one shard produce several frames. Those are
+    sent in rounds that each end with a GET frame, and a round's replies are
+    read before the next round is sent: a shard never holds more than one
+    GET reply while the client is still writing, so a reply larger than the
+    socket buffer cannot stall both ends. Mixed pipelines cost one round trip
+    per GET frame; pure set or get pipelines still take one.
+    """
+    def __init__(self, client: 'TimeMapClient'):
+        self.client = client
+        self.ops = []  # (shard index, op, item)
+
+    def set(self, key: str, value: str, timestamp: int) -> 'Pipeline':
+        self.ops.append((self.client._shard_for(key), OP_SET, (key, value, timestamp)))
+        return self
+
+    def get(self, key: str, timestamp: int) -> 'Pipeline':
+        self.ops.append((self.client._shard_for(key), OP_GET, (key, timestamp)))
+        return self
+
+    def execute(self) -> list:
+        # Per shard: list of [op, items, positions of the results in call order].
+        batches = {}
+        for position, (shard, op, item) in enumerate(self.ops):
+            shard_batches = batches.setdefault(shard, [])
+            if not shard_batches or shard_batches[-1][0] != op:
+                shard_batches.append([op, [], []])
+            shard_batches[-1][1].append(item)
+            shard_batches[-1][2].append(position)
+
+        rounds = {shard: self._rounds(shard_batches) for shard, shard_batches in batches.items()}
+        results = [None] * len(self.ops)
+        for step in range(max(map(len, rounds.values()), default=0)):
+            active = [(shard, shard_rounds[step]) for shard, shard_rounds in rounds.items() if step < len(shard_rounds)]
+            for shard, round_batches in active:
+                frames = b"".join(_encode_frame(op, items) for op, items, _ in round_batches)
+                self.client._connection(shard).sendall(frames)
+
+            for shard, round_batches in active:
+                rfile = self.client._rfiles[shard]
+                for op, items, positions in round_batches:
+                    frame = _read_frame(rfile)
+                    if frame is None:
+                        raise ConnectionError(f"shard {shard} closed the connection")
+                    if op == OP_GET:
+                        for position, value in zip(positions, _decode_values(frame[1])):
+                            results[position] = value
+        self.ops = []
+        return results
+
+    @staticmethod
+    def _rounds(shard_batches) -> list:
+        """Splits one shard's batches into runs ending with a GET batch (or the last batch)."""
+        rounds = [[]]
+        for batch in shard_batches:
+            if rounds[-1] and rounds[-1][-1][0] == OP_GET:
+                rounds.append([])
+            rounds[-1].append(batch)
+        return rounds if rounds[0] else []
+
+
+class TimeMapClient:
+    """
+    A thin client for TimeMapServer with the same set/get API as TimeMap, plus
+    batched mset/mget. Not thread-safe: use one client per thread.
+    """
+    def __init__(self, socket_dir: str, num_shards: int = 4):
+        self.paths = [os.path.join(socket_dir, f"shard-{i}.sock") for i in range(num_shards)]
+        self.ring = HashRing(range(num_shards))
+        self._sockets = {}
+        self._rfiles = {}
+
+    def _shard_for(self, key: str) -> int:
+        return self.ring.lookup(stable_hash(key))
+
+    def _connection(self, shard: int) -> socket.socket:
+        sock = self._sockets.get(shard)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.paths[shard])
+            self._sockets[shard] = sock
+            self._rfiles[shard] = sock.makefile("rb")
+        return sock
+
+    def pipeline(self) -> Pipeline:
+        return Pipeline(self)
+
+    def set(self, key: str, value: str, timestamp: int) -> None:
+        self.pipeline().set(key, value, timestamp).execute()
+
+    def get(self, key: str, timestamp: int) -> str:
+        return self.pipeline().get(key, timestamp).execute()[0]
+
+    def mset(self, items) -> None:
+        """Stores many (key, value, timestamp) triples in one round trip per shard."""
+        pipe = self.pipeline()
+        for key, value, timestamp in items:
+            pipe.set(key, value, timestamp)
+        pipe.execute()
+
+    def mget(self, items) -> list:
+        """Looks up many (key, timestamp) pairs in one round trip per shard."""
+        pipe = self.pipeline()
+        for key, timestamp in items:
+            pipe.get(key, timestamp)
+        return pipe.execute()
+
+    def close(self) -> None:
+        for rfile in self._rfiles.values():
+            rfile.close()
+        for sock in self._sockets.values():
+            sock.close()
+        self._sockets = {}
+        self._rfiles = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as socket_dir:
+        with TimeMapServer(socket_dir, num_shards=4):
+            with TimeMapClient(socket_dir, num_shards=4) as client:
+                client.set("foo", "bar", 1)
+                assert client.get("foo", 1) == "bar"
+                assert client.get("foo", 3) == "bar"
+                client.set("foo", "bar2", 4)
+                assert client.get("foo", 4) == "bar2"
+                assert client.get("foo", 0) == ""
+                assert client.get("missing", 5) == ""
+                print("Single set/get Passed!")
+
+                client.mset([(f"k{i}", f"v{i}", i) for i in range(1000)])
+                assert client.mget([(f"k{i}", i) for i in range(1000)]) == [f"v{i}" for i in range(1000)]
+                assert client.mget([("k5", 4), ("k5", 5), ("nope", 1)]) == ["", "v5", ""]
+                print("Batched mset/mget Passed!")
+
+                # A get pipelined after a set on the same key sees the set.
+                results = client.pipeline().set("p", "1", 1).get("p", 1).set("p", "2", 2).get("p", 5).execute()
+                assert results == [None, "1", None, "2"]
+                # Get replies larger than the socket buffer do not deadlock a mixed pipeline.
+                big = "x" * 100_000
+                pipe = client.pipeline()
+                for t in range(1, 41):
+                    pipe.set("big", f"{big}{t}", t).get("big", t)
+                assert pipe.execute()[1::2] == [f"{big}{t}" for t in range(1, 41)]
+                assert client.pipeline().execute() == []
+                print("Pipeline Passed!")
+
+                # A frame with an unknown op or a malformed payload only costs its own connection.
+                for frame in (_HEADER.pack(9, 4) + b"junk", _HEADER.pack(OP_GET, 2) + b"xx"):
+                    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as raw:
+                        raw.connect(client.paths[0])
+                        raw.sendall(frame)
+                        assert raw.recv(1) == b""
+                assert all(client.get(f"k{i}", i) == f"v{i}" for i in range(20))
+                print("Bad frames Passed!")
+
+            # Data lives in the worker processes, not in the client.
+            with TimeMapClient(socket_dir, num_shards=4) as other:
+                assert other.get("k999", 999) == "v999"
+            print("Multi-process TimeMap Passed!")
@@ -21,23 +21,35 @@ class FrequencyCache:
 
 # --- New, Concise Implementation as per your request ---
 
-def default_priority_rule(item1, item2):
-    """Default Rule: Returns True if item1 has HIGHER priority than item2."""
-    if item1.count != item2.count:
-        return item1.count > item2.count
-    return item1.key > item2.key
+def default_priority_key(item):
+    """Default Rule as a key function: a larger key means HIGHER priority."""
+    return (item.count, item.key)
+
+# Same as lru_cache2.RuleKey. The copy is intentional: this file is a standalone solution.
+class RuleKey:
+    """Adapts a pairwise rule(item1, item2) into a sort key."""
+    __slots__ = ("item", "rule")
+
+    def __init__(self, item, rule):
+        self.item = item
+        self.rule = rule
+
+    def __gt__(self, other):
+        return self.rule(self.item, other.item)
+
+    def __lt__(self, other):
+        return self.rule(other.item, self.item)
 
 class Item:
     """
-    An item in the cache. Its comparison logic is controlled by a
-    swappable class-level function `priority_rule`.
+    An item in the cache. It compares on `sort_key`, which its cache computes
+    from the cache's own priority key function, so rules never leak between
+    cache instances.
     """
-    # This class-level attribute will be used for all comparisons.
-    priority_rule = default_priority_rule
-
     def __init__(self, key, count=1):
         self.key = key
         self.count = count
+        self.sort_key = None
 
     def __lt__(self, other):
         """
@@ -46,7 +58,7 @@ class Item:
         a higher priority. This ensures the highest-priority item is the
         "smallest" and thus stays at the top of the min-heap.
         """
-        return self.priority_rule(self, other)
+        return self.sort_key > other.sort_key
 
     def __repr__(self):
         return f"Item(key={self.key}, count={self.count})"
@@ -54,21 +66,24 @@ class Item:
 class FrequencyCacheV2:
     """
     A concise implementation using Python's `heapq` library.
-    - Priority changes are handled by swapping the comparator on the Item class.
+    - Priorities come from a per-instance key function, cached on each item.
     - Updates and rule changes require an O(n) `heapify` operation.
     """
-    def __init__(self):
+    def __init__(self, priority_key=default_priority_key):
         self.items = {}  # Maps key -> Item object for quick access
         self.heap = []   # The heap, storing Item objects
+        self.priority_key = priority_key
 
     def addKey(self, key: str):
         if key not in self.items:
             item = Item(key, 1)
+            item.sort_key = self.priority_key(item)
             self.items[key] = item
             heapq.heappush(self.heap, item)
         else:
             item = self.items[key]
             item.count += 1
+            item.sort_key = self.priority_key(item)
             # This is concise, but O(n). Required to fix the heap after mutation.
             heapq.heapify(self.heap)
 
@@ -82,69 +97,79 @@ class FrequencyCacheV2:
         return self.heap[0].key
 
     def setPriorityRule(self, rule_func):
-        """Swaps the priority rule and rebuilds the heap. O(n)"""
-        Item.priority_rule = rule_func
+        """Swaps in a pairwise priority rule and rebuilds the heap. O(n)"""
+        self.setPriorityKey(lambda item: RuleKey(item, rule_func))
+
+    def setPriorityKey(self, key_func):
+        """Swaps the priority key function and rebuilds the heap. O(n)"""
+        self.priority_key = key_func
+        for item in self.heap:
+            item.sort_key = key_func(item)
         heapq.heapify(self.heap)
 
 # --- Tests for the new implementation ---
-print("--- Testing FrequencyCacheV2 ---")
-
-# Test 1: Basic functionality with default priority
-print("\n--- Test 1: Default Priority ---")
-cache = FrequencyCacheV2()
-cache.addKey("a")
-cache.addKey("b")
-# Default rule: count desc, key desc. With counts equal, 'b' > 'a'.
-assert cache.getMaxFrequencyKey() == "b"
-cache.addKey("a")  # a:2, b:1
-assert cache.getMaxFrequencyKey() == "a"
-assert cache.getCountForKey("a") == 2
-print("Test 1 Passed!")
-
-# Test 2: Changing the priority rule
-print("\n--- Test 2: Dynamic Priority ---")
-cache = FrequencyCacheV2()
-cache.addKey("a") # a:1
-cache.addKey("b") # b:1
-assert cache.getMaxFrequencyKey() == "b" # Default rule
-
-# New rule: count desc, but key ASC
-def new_rule(item1, item2):
-    if item1.count != item2.count:
-        return item1.count > item2.count
-    return item1.key < item2.key # Note: ascending key order
-
-cache.setPriorityRule(new_rule)
-# Counts are tied, 'a' < 'b', so 'a' now has higher priority.
-assert cache.getMaxFrequencyKey() == "a"
-cache.addKey("b") # b:2, a:1
-assert cache.getMaxFrequencyKey() == "b"
-print("Test 2 Passed!")
-
-# Reset to default rule for other tests
-Item.priority_rule = default_priority_rule
-
-print("\n--- Additional Tests ---")
-c = FrequencyCacheV2()
-assert c.getMaxFrequencyKey() == ""
-c.addKey(1)
-assert c.getMaxFrequencyKey() == 1
-c.addKey(2)
-assert c.getMaxFrequencyKey() == 2
-c.addKey(2)
-assert c.getMaxFrequencyKey() == 2
-c.addKey(3)
-assert c.getMaxFrequencyKey() == 2
-c.addKey(3)
-assert c.getMaxFrequencyKey() == 3
-c.addKey(3)
-assert c.getMaxFrequencyKey() == 3
-c.addKey(1)
-c.addKey(1)
-assert c.getMaxFrequencyKey() == 3
-c.addKey(1)
-assert c.getMaxFrequencyKey() == 1
-assert c.getCountForKey(1) == 4
-assert c.getCountForKey(2) == 2
-assert c.getCountForKey(3) == 3
-print("All tests passed!")
+if __name__ == "__main__":
+    print("--- Testing FrequencyCacheV2 ---")
+
+    # Test 1: Basic functionality with default priority
+    print("\n--- Test 1: Default Priority ---")
+    cache = FrequencyCacheV2()
+    cache.addKey("a")
+    cache.addKey("b")
+    # Default rule: count desc, key desc. With counts equal, 'b' > 'a'.
+    assert cache.getMaxFrequencyKey() == "b"
+    cache.addKey("a")  # a:2, b:1
+    assert cache.getMaxFrequencyKey() == "a"
+    assert cache.getCountForKey("a") == 2
+    print("Test 1 Passed!")
+
+    # Test 2: Changing the priority rule
+    print("\n--- Test 2: Dynamic Priority ---")
+    cache = FrequencyCacheV2()
+    cache.addKey("a") # a:1
+    cache.addKey("b") # b:1
+    assert cache.getMaxFrequencyKey() == "b" # Default rule
+
+    # New rule: count desc, but key ASC
+    def new_rule(item1, item2):
+        if item1.count != item2.count:
+            return item1.count > item2.count
+        return item1.key < item2.key # Note: ascending key order
+
+    cache.setPriorityRule(new_rule)
+    # Counts are tied, 'a' < 'b', so 'a' now has higher priority.
+    assert cache.getMaxFrequencyKey() == "a"
+    cache.addKey("b") # b:2, a:1
+    assert cache.getMaxFrequencyKey() == "b"
+    print("Test 2 Passed!")
+
+    # Rules are per instance: a new cache still uses the default rule.
+    other = FrequencyCacheV2()
+    other.addKey("a")
+    other.addKey("b")
+    assert other.getMaxFrequencyKey() == "b"
+
+    print("\n--- Additional Tests ---")
+    c = FrequencyCacheV2()
+    assert c.getMaxFrequencyKey() == ""
+    c.addKey(1)
+    assert c.getMaxFrequencyKey() == 1
+    c.addKey(2)
+    assert c.getMaxFrequencyKey() == 2
+    c.addKey(2)
+    assert c.getMaxFrequencyKey() == 2
+    c.addKey(3)
+    assert c.getMaxFrequencyKey() == 2
+    c.addKey(3)
+    assert c.getMaxFrequencyKey() == 3
+    c.addKey(3)
+    assert c.getMaxFrequencyKey() == 3
+    c.addKey(1)
+    c.addKey(1)
+    assert c.getMaxFrequencyKey() == 3
+    c.addKey(1)
+    assert c.getMaxFrequencyKey() == 1
+    assert c.getCountForKey(1) == 4
+    assert c.getCountForKey(2) == 2
+    assert c.getCountForKey(3) == 3
+    print("All tests passed!")
@@ -1,4 +1,14 @@
+import array
+import heapq
+import itertools
+import math
+import operator
+import random
+import struct
 import sys
+import threading
+import time
+from collections import defaultdict
 
 """
 This file provides a solution to the Frequency Cache problem described in lru_cache.md.
@@ -19,111 +29,173 @@ def default_priority_rule(item1, item2):
         return item1.count > item2.count
     return item1.key > item2.key
 
+# The same rule expressed as a key function: a larger key means higher priority.
+# Keys are computed once per change and cached on the item, so heap operations
+# compare plain tuples instead of calling a Python comparator on every step.
+def default_priority_key(item):
+    return (item.count, item.key)
+
+# With time decay, recent traffic counts more: rank by the decayed score instead.
+def decayed_priority_key(item):
+    return (item.score, item.key)
+
+class RuleKey:
+    """
+    Adapts a pairwise rule(item1, item2) into a sort key, so rules that cannot
+    be written as key functions still work (at the old per-comparison cost).
+    """
+    __slots__ = ("item", "rule")
+
+    def __init__(self, item, rule):
+        self.item = item
+        self.rule = rule
+
+    def __gt__(self, other):
+        return self.rule(self.item, other.item)
+
+    def __lt__(self, other):
+        return self.rule(other.item, self.item)
+
+def rule_to_key(rule):
+    """Turns a pairwise priority rule into a key function."""
+    return lambda item: RuleKey(item, rule)
+
 class Item:
-    """A simple data class to hold the key and its count."""
+    """A simple data class to hold the key, its count and its cached sort key."""
     def __init__(self, key, count=0):
         self.key = key
         self.count = count
+        self.score = 0.0  # forward-decayed count, only used with FrequencyCache(half_life=...)
+        self.sort_key = None
 
     def __repr__(self):
         return f"Item(key={self.key}, count={self.count})"
 
+class _FrontierEntry:
+    """An index into PriorityHeap.heap, ordered so heapq pops the highest priority first."""
+    __slots__ = ("sort_key", "index")
+
+    def __init__(self, sort_key, index):
+        self.sort_key = sort_key
+        self.index = index
+
+    def __lt__(self, other):
+        return self.sort_key > other.sort_key
+
 class PriorityHeap:
     """
-    A custom heap implementation that supports O(log n) updates and removals.
-    It uses a dictionary to keep track of the position of each key in the heap,
-    which is crucial for efficient updates.
+    A custom heap implementation that supports O(log n) updates and removals
+    at both ends of the priority order.
+    It keeps two heaps over the same items: `heap` has the highest-priority
+    item on top, `low_heap` the lowest. Each has a dictionary tracking the
+    position of every key, which is crucial for efficient updates.
+
+    Priorities come from `priority_key(item)`; the result is cached on
+    `item.sort_key` and refreshed by push/update, and the two heaps compare
+    cached keys with operator.gt / operator.lt.
     """
-    def __init__(self, priority_rule):
+    def __init__(self, priority_key=default_priority_key):
         self.heap = []
         self.positions = {}
-        self.priority_rule = priority_rule
+        self.low_heap = []
+        self.low_positions = {}
+        self.priority_key = priority_key
 
-    def _swap(self, i, j):
-        """Swaps two elements in the heap and updates their positions."""
-        item1_key = self.heap[i].key
-        item2_key = self.heap[j].key
+    def _sides(self):
+        return ((self.heap, self.positions, operator.gt),
+                (self.low_heap, self.low_positions, operator.lt))
 
-        self.positions[item1_key], self.positions[item2_key] = j, i
-        self.heap[i], self.heap[j] = self.heap[j], self.heap[i]
+    @staticmethod
+    def _swap(heap, positions, i, j):
+        """Swaps two elements in the heap and updates their positions."""
+        positions[heap[i].key], positions[heap[j].key] = j, i
+        heap[i], heap[j] = heap[j], heap[i]
 
-    def _sift_up(self, i):
+    def _sift_up(self, heap, positions, before, i):
         """Moves an element up the heap to its correct position."""
-        parent_idx = (i - 1) // 2
-        while i > 0 and self.priority_rule(self.heap[i], self.heap[parent_idx]):
-            self._swap(i, parent_idx)
-            i = parent_idx
+        while i > 0:
             parent_idx = (i - 1) // 2
+            if not before(heap[i].sort_key, heap[parent_idx].sort_key):
+                break
+            self._swap(heap, positions, i, parent_idx)
+            i = parent_idx
 
-    def _sift_down(self, i):
+    def _sift_down(self, heap, positions, before, i):
         """Moves an element down the heap to its correct position."""
-        max_index = i
-        left_child_idx = 2 * i + 1
-        right_child_idx = 2 * i + 2
+        n = len(heap)
+        while True:
+            top_index = i
+            left_child_idx = 2 * i + 1
+            right_child_idx = 2 * i + 2
 
-        if left_child_idx < len(self.heap) and self.priority_rule(self.heap[left_child_idx], self.heap[max_index]):
-            max_index = left_child_idx
+            if left_child_idx < n and before(heap[left_child_idx].sort_key, heap[top_index].sort_key):
+                top_index = left_child_idx
 
-        if right_child_idx < len(self.heap) and self.priority_rule(self.heap[right_child_idx], self.heap[max_index]):
-            max_index = right_child_idx
+            if right_child_idx < n and before(heap[right_child_idx].sort_key, heap[top_index].sort_key):
+                top_index = right_child_idx
 
-        if i != max_index:
-            self._swap(i, max_index)
-            self._sift_down(max_index)
+            if top_index == i:
+                return
+            self._swap(heap, positions, i, top_index)
+            i = top_index
 
     def push(self, item):
         """Adds a new item to the heap."""
-        self.heap.append(item)
-        self.positions[item.key] = len(self.heap) - 1
-        self._sift_up(len(self.heap) - 1)
+        item.sort_key = self.priority_key(item)
+        for heap, positions, before in self._sides():
+            heap.append(item)
+            positions[item.key] = len(heap) - 1
+            self._sift_up(heap, positions, before, len(heap) - 1)
+
+    def _remove_at(self, heap, positions, before, idx):
+        """Removes and returns heap[idx] from one side in O(log n)."""
+        last = len(heap) - 1
+        if idx != last:
+            self._swap(heap, positions, idx, last)
+        item = heap.pop()
+        del positions[item.key]
+
+        # If the removed item was not the last one, we need to fix the heap.
+        if idx < len(heap):
+            # We don't know if the swapped element should go up or down, so try both.
+            self._sift_up(heap, positions, before, idx)
+            self._sift_down(heap, positions, before, idx)
+        return item
 
     def pop(self):
         """Removes and returns the highest-priority item from the heap."""
         if not self.heap:
             return None
+        return self.remove(self.heap[0].key)
 
-        root_item = self.heap[0]
-        if len(self.heap) > 1:
-            last_item = self.heap.pop()
-            del self.positions[root_item.key]
-            self.heap[0] = last_item
-            self.positions[last_item.key] = 0
-            self._sift_down(0)
-        else:
-            self.heap.pop()
-            del self.positions[root_item.key]
-
-        return root_item
+    def pop_lowest(self):
+        """Removes and returns the lowest-priority item in O(log n)."""
+        if not self.low_heap:
+            return None
+        return self.remove(self.low_heap[0].key)
 
     def update(self, key):
         """
         To be called when an item's priority might have changed.
-        It finds the item and re-heapifies it.
+        It finds the item and re-heapifies it on both sides.
         """
         if key not in self.positions:
             return
-        idx = self.positions[key]
-        # An item's priority only increases in this problem, so we only need to sift up.
-        self._sift_up(idx)
+        item = self.heap[self.positions[key]]
+        item.sort_key = self.priority_key(item)
+        for heap, positions, before in self._sides():
+            idx = positions[key]
+            self._sift_up(heap, positions, before, idx)
+            self._sift_down(heap, positions, before, positions[key])
 
     def remove(self, key):
         """Removes an item from the heap by its key in O(log n)."""
         if key not in self.positions:
             return None
 
-        idx_to_remove = self.positions[key]
-
-        self._swap(idx_to_remove, len(self.heap) - 1)
-
-        item_removed = self.heap.pop()
-        del self.positions[key]
-
-        # If the removed item was not the last one, we need to fix the heap
-        if idx_to_remove < len(self.heap):
-            # We don't know if the swapped element should go up or down, so try both.
-            self._sift_up(idx_to_remove)
-            self._sift_down(idx_to_remove)
-
+        item_removed = None
+        for heap, positions, before in self._sides():
+            item_removed = self._remove_at(heap, positions, before, positions[key])
         return item_removed
 
     def peek(self):
@@ -131,34 +203,48 @@ class PriorityHeap:
         return self.heap[0] if self.heap else None
 
     def find_lowest_priority_item(self):
-        """
-        Finds the item with the lowest priority.
-        This is an O(n) operation. For a more performant solution
-        for frequent evictions, a second min-heap would be required.
-        """
-        if not self.heap:
-            return None
-
-        # The lowest priority items in a max-heap are always at the leaf nodes.
-        # We only need to check the second half of the array.
-        start_index = len(self.heap) // 2
-        if start_index == 0 and len(self.heap) > 0:
-             return self.heap[0]
-        if start_index >= len(self.heap):
-             return None
+        """Returns the lowest-priority item without removing it. O(1)."""
+        return self.low_heap[0] if self.low_heap else None
 
-        lowest_item = self.heap[start_index]
-        for i in range(start_index + 1, len(self.heap)):
-            if self.priority_rule(lowest_item, self.heap[i]):
-                lowest_item = self.heap[i]
-        return lowest_item
+    def set_priority_key(self, new_key):
+        """Updates the priority key function and rebuilds both heaps in O(n)."""
+        self.priority_key = new_key
+        for item in self.heap:
+            item.sort_key = new_key(item)
+        # Rebuild the heaps from the bottom up.
+        for heap, positions, before in self._sides():
+            for i in range((len(heap) // 2) - 1, -1, -1):
+                self._sift_down(heap, positions, before, i)
 
     def set_priority_rule(self, new_rule):
-        """Updates the priority rule and rebuilds the entire heap in O(n)."""
-        self.priority_rule = new_rule
-        # Rebuild the heap from the bottom up.
-        for i in range((len(self.heap) // 2) - 1, -1, -1):
-            self._sift_down(i)
+        """Updates the priority from a pairwise rule (see RuleKey). O(n)."""
+        self.set_priority_key(rule_to_key(new_rule))
+
+    def bulk_load(self, items):
+        """Adds many items at once and rebuilds both heaps bottom-up in O(n)."""
+        for item in items:
+            for heap, positions, _ in self._sides():
+                positions[item.key] = len(heap)
+                heap.append(item)
+        self.set_priority_key(self.priority_key)
+
+    def iter_top(self):
+        """
+        Lazily yields items from highest to lowest priority without copying or
+        modifying the heap. A small frontier heap holds the candidates: the root
+        first, then the children of each item yielded, so the first k items cost
+        O(k log k). The heap must not be modified while iterating.
+        """
+        heap = self.heap
+        if not heap:
+            return
+        frontier = [_FrontierEntry(heap[0].sort_key, 0)]
+        while frontier:
+            index = heapq.heappop(frontier).index
+            yield heap[index]
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < len(heap):
+                    heapq.heappush(frontier, _FrontierEntry(heap[child].sort_key, child))
 
     def __len__(self):
         return len(self.heap)
@@ -166,35 +252,67 @@ class PriorityHeap:
 class FrequencyCache:
     """
     A frequency-based cache that supports dynamic priority rules and a capacity limit.
+
+    With `half_life` (in clock units), counts decay exponentially so that
+    priorities reflect recent traffic. Decay is lazy ("forward decay"): a hit at
+    time t adds 2 ** ((t - epoch) / half_life) to `item.score` instead of
+    shrinking every other score. All scores would shrink by the same factor,
+    so their order is unchanged and nothing needs rescanning; the decayed count
+    is only computed when asked for. The epoch moves forward (an O(n) rescale)
+    only when weights approach float limits, i.e. once every 512 half-lives.
     """
-    def __init__(self, capacity=sys.maxsize):
+    MAX_DECAY_EXPONENT = 512
+
+    def __init__(self, capacity=sys.maxsize, half_life=None, clock=time.monotonic):
         self.capacity = capacity
         self.items = {}  # key -> Item(key, count)
+        self.half_life = half_life
+        self.clock = clock
+        self.epoch = clock() if half_life else 0.0
         # The default rule is used for initialization.
-        self.priority_rule = default_priority_rule
-        self.heap = PriorityHeap(self.priority_rule)
+        self.priority_key = decayed_priority_key if half_life else default_priority_key
+        self.heap = PriorityHeap(self.priority_key)
 
-    def addKey(self, key: str) -> str:
+    def _decay_weight(self) -> float:
+        """The weight of a hit now, relative to the epoch."""
+        now = self.clock()
+        exponent = (now - self.epoch) / self.half_life
+        if exponent > self.MAX_DECAY_EXPONENT:
+            factor = 2.0 ** -exponent
+            for item in self.items.values():
+                item.score *= factor
+            self.epoch = now
+            self.heap.set_priority_key(self.priority_key)
+            exponent = 0.0
+        return 2.0 ** exponent
+
+    def addKey(self, key: str, count: int = 1) -> str:
         """
-        Adds a key to the cache or increments its frequency.
+        Adds a key to the cache or increments its frequency (by `count` at once,
+        which costs a single heap update).
         If the cache is full, it evicts the lowest-priority item.
         Returns the key of the evicted item, or an empty string if no item was evicted.
         """
         evicted_key = ""
         if key not in self.items:
             if len(self.heap) >= self.capacity:
-                item_to_evict = self.heap.find_lowest_priority_item()
+                item_to_evict = self.heap.pop_lowest()
                 if item_to_evict:
-                    self.heap.remove(item_to_evict.key)
                     del self.items[item_to_evict.key]
                     evicted_key = item_to_evict.key
 
-            new_item = Item(key, 1)
+            new_item = Item(key, count)
+            if self.half_life:
+                new_item.score = self._decay_weight() * count
             self.items[key] = new_item
             self.heap.push(new_item)
         else:
             item = self.items[key]
-            item.count += 1
+            item.count += count
+            if self.half_life:
+                # Compute the weight first: it may rescale item.score.
+                weight = self._decay_weight()
+                item.score += weight * count
             self.heap.update(key)
 
         return evicted_key
@@ -203,104 +321,911 @@ class FrequencyCache:
         """Returns the frequency count for a given key."""
         return self.items[key].count if key in self.items else 0
 
+    def getDecayedCountForKey(self, key: str) -> float:
+        """Returns the exponentially decayed count as of now (the raw count without half_life)."""
+        if key not in self.items:
+            return 0
+        if not self.half_life:
+            return self.items[key].count
+        return self.items[key].score * 2.0 ** (-(self.clock() - self.epoch) / self.half_life)
+
     def getMaxFrequencyKey(self) -> str:
         """Returns the key with the highest priority."""
         item = self.heap.peek()
         return item.key if item else ""
 
+    def iter_by_priority(self):
+        """Lazily yields (key, count) in priority order. Do not addKey while iterating."""
+        for item in self.heap.iter_top():
+            yield item.key, item.count
+
+    def top_k(self, k) -> list:
+        """The k highest-priority keys as (key, count), highest first. O(k log k)."""
+        return list(itertools.islice(self.iter_by_priority(), k))
+
     def setPriorityRule(self, rule_func):
         """
         Sets a new priority rule for the cache and rebuilds the heap.
         The rule_func(item1, item2) should return True if item1 has higher priority.
+        Prefer setPriorityKey when the rule can be written as a key function.
         """
-        self.priority_rule = rule_func
-        self.heap.set_priority_rule(self.priority_rule)
+        self.setPriorityKey(rule_to_key(rule_func))
+
+    def setPriorityKey(self, key_func):
+        """
+        Sets a new priority rule as a key function and rebuilds the heap in O(n).
+        key_func(item) returns a comparable key (usually a tuple); larger keys
+        have higher priority. The key is recomputed whenever the item's count changes.
+        """
+        self.priority_key = key_func
+        self.heap.set_priority_key(self.priority_key)
+
+    # Snapshot format: magic, entry count (I), then per entry a key tag (B),
+    # the key (a q for ints, or a length-prefixed I + UTF-8 for strings) and its count (Q).
+    SNAPSHOT_MAGIC = b"FQC1"
+    _KEY_STR = 0
+    _KEY_INT = 1
+
+    def snapshot(self) -> bytes:
+        """
+        Serializes keys and raw counts into a compact binary blob.
+        Keys must be str or int. Decayed scores are not saved: on load each
+        count is treated as recent traffic (use `decay` to discount it).
+        """
+        out = bytearray(self.SNAPSHOT_MAGIC)
+        out += struct.pack("!I", len(self.items))
+        for key, item in self.items.items():
+            if isinstance(key, str):
+                data = key.encode()
+                out += struct.pack("!BI", self._KEY_STR, len(data))
+                out += data
+            elif isinstance(key, int):
+                out += struct.pack("!Bq", self._KEY_INT, key)
+            else:
+                raise TypeError(f"cannot snapshot key of type {type(key).__name__}")
+            out += struct.pack("!Q", item.count)
+        return bytes(out)
+
+    @classmethod
+    def parse_snapshot(cls, data: bytes):
+        """Yields (key, count) pairs from a snapshot() blob."""
+        if data[:4] != cls.SNAPSHOT_MAGIC:
+            raise ValueError("not a FrequencyCache snapshot")
+        (n,) = struct.unpack_from("!I", data, 4)
+        offset = 8
+        for _ in range(n):
+            (tag,) = struct.unpack_from("!B", data, offset)
+            offset += 1
+            if tag == cls._KEY_STR:
+                (length,) = struct.unpack_from("!I", data, offset)
+                offset += 4
+                key = data[offset:offset + length].decode()
+                offset += length
+            elif tag == cls._KEY_INT:
+                (key,) = struct.unpack_from("!q", data, offset)
+                offset += 8
+            else:
+                raise ValueError(f"bad key tag {tag} in snapshot")
+            (count,) = struct.unpack_from("!Q", data, offset)
+            offset += 8
+            yield key, count
+
+    def bulk_load(self, pairs, decay: float = 1.0) -> None:
+        """
+        Adds many (key, count) pairs, each count multiplied by `decay` (keys
+        that decay to 0 are dropped), then rebuilds the heap once in O(n)
+        instead of n pushes. Counts of keys already present are added.
+        If over capacity afterwards, the lowest-priority items are evicted.
+        """
+        weight = self._decay_weight() if self.half_life else 0.0
+        new_items = []
+        for key, count in pairs:
+            count = int(count * decay)
+            if count <= 0:
+                continue
+            item = self.items.get(key)
+            if item is None:
+                item = Item(key, 0)
+                self.items[key] = item
+                new_items.append(item)
+            item.count += count
+            item.score += weight * count
+        # Existing items may have grown too: the rebuild re-keys everything.
+        self.heap.bulk_load(new_items)
+        while len(self.heap) > self.capacity:
+            del self.items[self.heap.pop_lowest().key]
+
+    def save(self, path) -> None:
+        with open(path, "wb") as f:
+            f.write(self.snapshot())
+
+    @classmethod
+    def load(cls, path, decay: float = 1.0, **kwargs) -> 'FrequencyCache':
+        """Creates a warm cache from a file written by save(). kwargs go to the constructor."""
+        with open(path, "rb") as f:
+            data = f.read()
+        cache = cls(**kwargs)
+        cache.bulk_load(cls.parse_snapshot(data), decay)
+        return cache
+
+class _Descending:
+    """Wraps a key so that heapq, a min-heap, pops the largest key first."""
+    __slots__ = ("key",)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+
+class FrequencyBucket:
+    """
+    A node in BucketFrequencyCache's list: all keys with the same count.
+    The smallest and largest key come from a min-heap and a max-heap with
+    lazy deletion: a removed key stays in the heaps until it reaches the top,
+    and `members` says which entries are live. The heaps are rebuilt once
+    more than half their entries are stale, so every operation is O(log n)
+    amortised in the bucket's size.
+    """
+    def __init__(self, count):
+        self.count = count
+        self.members = set()
+        self.low = []   # min-heap of keys, may hold stale entries
+        self.high = []  # max-heap of _Descending(key), may hold stale entries
+        self.prev = None
+        self.next = None
+
+    def add(self, key):
+        self.members.add(key)
+        heapq.heappush(self.low, key)
+        heapq.heappush(self.high, _Descending(key))
+
+    def discard(self, key):
+        self.members.discard(key)
+        # Either heap can be the bloated one: eviction drains `low` through
+        # smallest() while `high` keeps every stale entry.
+        if max(len(self.low), len(self.high)) > 2 * len(self.members) + 8:
+            self.low = list(self.members)
+            heapq.heapify(self.low)
+            self.high = [_Descending(member) for member in self.members]
+            heapq.heapify(self.high)
+
+    def smallest(self):
+        low, members = self.low, self.members
+        while low[0] not in members:
+            heapq.heappop(low)
+        return low[0]
+
+    def largest(self):
+        high, members = self.high, self.members
+        while high[0].key not in members:
+            heapq.heappop(high)
+        return high[0].key
+
+    def __repr__(self):
+        return f"FrequencyBucket(count={self.count}, keys={sorted(self.members)})"
+
+class BucketFrequencyCache:
+    """
+    An LFU engine for the default priority rule (count desc, then key desc).
+
+    Keys are grouped into buckets by count; buckets form a doubly linked list
+    ordered by count, and each bucket orders its keys with a pair of heaps
+    (see FrequencyBucket). Since a count only ever moves to the neighbouring bucket:
+    - addKey moves the key from bucket c to bucket c+1 (created next to it if missing).
+    - getMaxFrequencyKey is the largest key of the last bucket.
+    - eviction removes the smallest key of the first bucket.
+    Moving between buckets is O(1); ordering within a bucket is O(log n) in
+    the bucket's size, which is where ties pile up (e.g. many keys seen once).
+    Custom rules need FrequencyCache.
+    """
+    def __init__(self, capacity=sys.maxsize):
+        self.capacity = capacity
+        self.buckets = {}  # key -> FrequencyBucket holding it
+        self.head = None   # lowest count
+        self.tail = None   # highest count
+
+    def _insert_after(self, node, bucket):
+        """Links `bucket` after `node`, or at the head when node is None."""
+        bucket.prev = node
+        bucket.next = node.next if node else self.head
+        if bucket.next:
+            bucket.next.prev = bucket
+        else:
+            self.tail = bucket
+        if node:
+            node.next = bucket
+        else:
+            self.head = bucket
+
+    def _unlink(self, bucket):
+        if bucket.prev:
+            bucket.prev.next = bucket.next
+        else:
+            self.head = bucket.next
+        if bucket.next:
+            bucket.next.prev = bucket.prev
+        else:
+            self.tail = bucket.prev
+
+    def _remove_key(self, bucket, key):
+        bucket.discard(key)
+        if not bucket.members:
+            self._unlink(bucket)
+
+    def addKey(self, key: str) -> str:
+        """
+        Adds a key to the cache or increments its frequency.
+        If the cache is full, it evicts the lowest-priority item.
+        Returns the key of the evicted item, or an empty string if no item was evicted.
+        """
+        evicted_key = ""
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.capacity and self.head:
+                lowest = self.head
+                evicted_key = lowest.smallest()
+                self._remove_key(lowest, evicted_key)
+                del self.buckets[evicted_key]
+
+            target = self.head
+            if target is None or target.count != 1:
+                target = FrequencyBucket(1)
+                self._insert_after(None, target)
+        else:
+            target = bucket.next
+            if target is None or target.count != bucket.count + 1:
+                target = FrequencyBucket(bucket.count + 1)
+                self._insert_after(bucket, target)
+            self._remove_key(bucket, key)
+
+        target.add(key)
+        self.buckets[key] = target
+        return evicted_key
+
+    def getCountForKey(self, key: str) -> int:
+        """Returns the frequency count for a given key."""
+        bucket = self.buckets.get(key)
+        return bucket.count if bucket else 0
+
+    def getMaxFrequencyKey(self) -> str:
+        """Returns the key with the highest priority."""
+        return self.tail.largest() if self.tail else ""
+
+    def getMinFrequencyKey(self) -> str:
+        """Returns the key with the lowest priority, i.e. the next to be evicted."""
+        return self.head.smallest() if self.head else ""
+
+    def removeKey(self, key) -> bool:
+        """Removes a key regardless of its count. Returns False if it was not present."""
+        bucket = self.buckets.pop(key, None)
+        if bucket is None:
+            return False
+        self._remove_key(bucket, key)
+        return True
+
+    def replaceLowest(self, key):
+        """
+        Gives the lowest-priority key's slot to `key` with that count + 1, in O(log n).
+        This is the Space-Saving replacement step. Returns (evicted_key, evicted_count).
+        """
+        lowest = self.head
+        evicted_key = lowest.smallest()
+        target = lowest.next
+        if target is None or target.count != lowest.count + 1:
+            target = FrequencyBucket(lowest.count + 1)
+            self._insert_after(lowest, target)
+        self._remove_key(lowest, evicted_key)
+        del self.buckets[evicted_key]
+
+        target.add(key)
+        self.buckets[key] = target
+        return evicted_key, lowest.count
+
+    def __len__(self):
+        return len(self.buckets)
+
+class CountMinSketch:
+    """
+    Approximate counts in fixed memory: `depth` rows of `width` counters.
+    A key increments one counter per row and its estimate is the minimum of
+    them, so estimates never undercount. With width = ceil(e / epsilon) and
+    depth = ceil(ln(1 / delta)), an estimate exceeds the true count by more
+    than epsilon * total with probability at most delta.
+    """
+    def __init__(self, width=2048, depth=4):
+        self.width = width
+        self.depth = depth
+        self.rows = [array.array("q", bytes(8 * width)) for _ in range(depth)]
+        self.total = 0
+
+    @classmethod
+    def from_error(cls, epsilon, delta):
+        return cls(math.ceil(math.e / epsilon), math.ceil(math.log(1 / delta)))
+
+    MASK64 = (1 << 64) - 1
+
+    @classmethod
+    def _mix64(cls, x):
+        """splitmix64 finalizer: every output bit depends on every input bit."""
+        x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & cls.MASK64
+        x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & cls.MASK64
+        return x ^ (x >> 31)
+
+    def _indexes(self, key):
+        # Double hashing: row i uses h1 + i * h2, which is as good as independent
+        # hashes here, provided h1 and h2 are well mixed (builtin hash() is not;
+        # e.g. small ints hash to themselves).
+        h = hash(key) & self.MASK64
+        h1 = self._mix64(h)
+        h2 = self._mix64(h ^ 0x9E3779B97F4A7C15) | 1
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def add(self, key, count=1) -> int:
+        """
+        Adds `count` occurrences and returns the new estimate.
+        Uses conservative update: only counters below the new estimate grow,
+        which keeps the same guarantee with much smaller overcounts.
+        """
+        indexes = self._indexes(key)
+        rows = self.rows
+        estimate = min(rows[i][j] for i, j in enumerate(indexes)) + count
+        for i, j in enumerate(indexes):
+            if rows[i][j] < estimate:
+                rows[i][j] = estimate
+        self.total += count
+        return estimate
+
+    def estimate(self, key) -> int:
+        return min(self.rows[i][j] for i, j in enumerate(self._indexes(key)))
+
+    def halve(self):
+        """Ages all counts by half, so old popularity fades (used by TinyLFU). O(width * depth)."""
+        for row in self.rows:
+            for j in range(self.width):
+                row[j] >>= 1
+        self.total >>= 1
+
+    def error_bound(self) -> float:
+        """Additive error that holds with probability 1 - confidence_miss()."""
+        return math.e / self.width * self.total
+
+    def confidence_miss(self) -> float:
+        return math.exp(-self.depth)
+
+class ApproximateFrequencyCache:
+    """
+    A fixed-memory FrequencyCache for high-cardinality streams.
+
+    - Counts come from a CountMinSketch (never under, bounded over).
+    - Hot keys are tracked by Space-Saving with `heavy_hitters` counters kept
+      in a BucketFrequencyCache: a new key replaces the smallest counter and
+      inherits its count + 1. Every key whose true count exceeds
+      total / heavy_hitters is guaranteed to be tracked, and a tracked count
+      overestimates by at most the count it inherited (kept in `errors`).
+    Memory is width * depth * 8 bytes for the sketch plus `heavy_hitters`
+    entries, independent of the number of distinct keys.
+    """
+    def __init__(self, heavy_hitters=100, width=2048, depth=4):
+        self.sketch = CountMinSketch(width, depth)
+        self.top = BucketFrequencyCache(capacity=heavy_hitters)
+        self.errors = {}  # tracked key -> overcount inherited on replacement (absent means exact)
+
+    @classmethod
+    def from_error(cls, epsilon, delta, heavy_hitters=100):
+        sketch = CountMinSketch.from_error(epsilon, delta)
+        return cls(heavy_hitters, sketch.width, sketch.depth)
+
+    def addKey(self, key) -> str:
+        """
+        Records one occurrence of `key`.
+        Returns the key that dropped out of the heavy-hitter set, or "".
+        """
+        self.sketch.add(key)
+        top = self.top
+        if key in top.buckets or len(top) < top.capacity:
+            top.addKey(key)
+            return ""
+        evicted_key, evicted_count = top.replaceLowest(key)
+        self.errors.pop(evicted_key, None)
+        self.errors[key] = evicted_count
+        return evicted_key
+
+    def getCountForKey(self, key) -> int:
+        """An estimate that is never below the true count."""
+        estimate = self.sketch.estimate(key)
+        tracked = self.top.getCountForKey(key)
+        return min(estimate, tracked) if tracked else estimate
+
+    def getMaxFrequencyKey(self) -> str:
+        return self.top.getMaxFrequencyKey()
+
+    def top_k(self, k) -> list:
+        """The k hottest tracked keys as (key, estimated count), highest first."""
+        result = []
+        bucket = self.top.tail
+        while bucket and len(result) < k:
+            for key in heapq.nlargest(k - len(result), bucket.members):
+                result.append((key, bucket.count))
+            bucket = bucket.prev
+        return result
+
+    def error_bounds(self) -> dict:
+        total = self.sketch.total
+        return {
+            "total": total,
+            # getCountForKey overcounts by at most this, with probability `confidence`.
+            "count_error": self.sketch.error_bound(),
+            "confidence": 1 - self.sketch.confidence_miss(),
+            # Any key more frequent than this is guaranteed to be in top_k.
+            "heavy_hitter_threshold": total / self.top.capacity,
+            "memory_bytes": self.sketch.width * self.sketch.depth * 8,
+        }
+
+class _IncrementBuffer:
+    """Pending increments of one thread. Its lock is only contended while sync() drains it."""
+    __slots__ = ("lock", "counts", "pending", "thread")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.pending = 0
+        self.thread = threading.current_thread()
+
+class ConcurrentFrequencyCache:
+    """
+    A thread-safe FrequencyCache for many concurrent producers.
+
+    - Keys are spread over `num_shards` FrequencyCaches, each with its own lock.
+    - addKey only touches a per-thread buffer of pending counts; once it holds
+      `flush_threshold` hits it is applied in one batch, locking each shard
+      once and doing one heap update per distinct key.
+    - Queries first sync() all buffers, then merge the shards' tops. The merged
+      top-k is cached until the next flush.
+    `capacity` is split evenly over the shards. Time decay is not supported
+    here, since shards would not share an epoch.
+    """
+    def __init__(self, num_shards=16, capacity=sys.maxsize, flush_threshold=64):
+        self.shards = [FrequencyCache(max(1, capacity // num_shards)) for _ in range(num_shards)]
+        self.locks = [threading.Lock() for _ in range(num_shards)]
+        self.flush_threshold = flush_threshold
+        self._local = threading.local()
+        self._buffers = []
+        self._buffers_lock = threading.Lock()
+        # Every flush takes a fresh number from _versions (next() on a count is
+        # atomic, unlike `+= 1`) and stores it in _version. A number is only
+        # ever stored once, so a cached top can never match a later version.
+        self._versions = itertools.count(1)
+        self._version = 0
+        self._top_cache = (-1, [])  # (version, merged top list)
+
+    def _shard_index(self, key) -> int:
+        return hash(key) % len(self.shards)
+
+    def _buffer(self) -> _IncrementBuffer:
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None:
+            buffer = self._local.buffer = _IncrementBuffer()
+            with self._buffers_lock:
+                self._buffers.append(buffer)
+        return buffer
+
+    def addKey(self, key) -> None:
+        buffer = self._buffer()
+        with buffer.lock:
+            buffer.counts[key] = buffer.counts.get(key, 0) + 1
+            buffer.pending += 1
+            full = buffer.pending >= self.flush_threshold
+        if full:
+            self._flush_buffer(buffer)
+
+    def _flush_buffer(self, buffer) -> list:
+        """Applies a buffer's pending counts. Returns the keys evicted meanwhile."""
+        with buffer.lock:
+            counts, buffer.counts = buffer.counts, {}
+            buffer.pending = 0
+        if not counts:
+            return []
+
+        batches = defaultdict(list)
+        for key, count in counts.items():
+            batches[self._shard_index(key)].append((key, count))
+        evicted = []
+        for index, batch in batches.items():
+            shard = self.shards[index]
+            with self.locks[index]:
+                for key, count in batch:
+                    evicted_key = shard.addKey(key, count)
+                    if evicted_key != "":
+                        evicted.append(evicted_key)
+        self._version = next(self._versions)
+        return evicted
+
+    def flush(self) -> list:
+        """Applies the calling thread's pending counts."""
+        return self._flush_buffer(self._buffer())
+
+    def sync(self) -> list:
+        """Applies every thread's pending counts and forgets buffers of finished threads."""
+        with self._buffers_lock:
+            buffers = list(self._buffers)
+        evicted = []
+        for buffer in buffers:
+            evicted += self._flush_buffer(buffer)
+        with self._buffers_lock:
+            self._buffers = [b for b in self._buffers if b.thread.is_alive() or b.pending]
+        return evicted
+
+    def getCountForKey(self, key) -> int:
+        self.sync()
+        index = self._shard_index(key)
+        with self.locks[index]:
+            return self.shards[index].getCountForKey(key)
+
+    def getMaxFrequencyKey(self) -> str:
+        top = self.top_k(1)
+        return top[0][0] if top else ""
+
+    def top_k(self, k) -> list:
+        """The k highest-priority keys as (key, count), highest first."""
+        self.sync()
+        version, cached = self._top_cache
+        if version == self._version and len(cached) >= k:
+            return cached[:k]
+
+        version = self._version
+        candidates = []
+        for shard, lock in zip(self.shards, self.locks):
+            with lock:
+                top = itertools.islice(shard.heap.iter_top(), k)
+                candidates += [(item.sort_key, item.key, item.count) for item in top]
+        merged = [(key, count) for _, key, count in heapq.nlargest(k, candidates, key=operator.itemgetter(0))]
+        self._top_cache = (version, merged)
+        return merged
+
+    def setPriorityKey(self, key_func):
+        for shard, lock in zip(self.shards, self.locks):
+            with lock:
+                shard.setPriorityKey(key_func)
+        self._version = next(self._versions)
 
 # --- Example Usage and Tests ---
+if __name__ == "__main__":
+    # Phase 1: Basic functionality
+    print("--- Phase 1: Basic ---")
+    cache = FrequencyCache()
+    cache.addKey("a")
+    cache.addKey("b")
+    # Tie in count, "b" > "a" lexicographically
+    assert cache.getMaxFrequencyKey() == "b"
+    cache.addKey("a")  # a count becomes 2
+    assert cache.getMaxFrequencyKey() == "a"
+    assert cache.getCountForKey("a") == 2
+    assert cache.getCountForKey("b") == 1
+    assert cache.getCountForKey("c") == 0
+    print("Phase 1 Passed!")
 
-# Phase 1: Basic functionality
-print("--- Phase 1: Basic ---")
-cache = FrequencyCache()
-cache.addKey("a")
-cache.addKey("b")
-# Tie in count, "b" > "a" lexicographically
-assert cache.getMaxFrequencyKey() == "b"
-cache.addKey("a")  # a count becomes 2
-assert cache.getMaxFrequencyKey() == "a"
-assert cache.getCountForKey("a") == 2
-assert cache.getCountForKey("b") == 1
-assert cache.getCountForKey("c") == 0
-print("Phase 1 Passed!")
-
-# Phase 2 & 3: Dynamic priority rule
-print("\n--- Phase 2 & 3: Dynamic Priority ---")
-cache = FrequencyCache()
-cache.addKey("a")
-cache.addKey("b")
-# Default rule: b > a
-assert cache.getMaxFrequencyKey() == "b"
-
-# New rule: frequency desc, then key asc
-def new_rule(item1, item2):
-    if item1.count != item2.count:
-        return item1.count > item2.count
-    return item1.key < item2.key # Note the '<'
-
-cache.setPriorityRule(new_rule)
-# Tie in count, 'a' < 'b' so 'a' has higher priority now
-assert cache.getMaxFrequencyKey() == "a"
-cache.addKey("b") # b count becomes 2
-assert cache.getMaxFrequencyKey() == "b"
-print("Phase 2 & 3 Passed!")
-
-# Phase 4: Capacity limit
-print("\n--- Phase 4: Capacity Limit ---")
-# Use the new rule (key asc for ties)
-cache = FrequencyCache(capacity=2)
-cache.setPriorityRule(new_rule)
-cache.addKey("a") # a:1
-cache.addKey("b") # b:1, a:1 -> max is 'a' due to rule
-assert cache.getMaxFrequencyKey() == "a"
-# Add 'c', capacity is full.
-# Eviction check: 'a' and 'b' have count 1. 'b' has lower priority (b > a).
-# So 'b' should be evicted.
-evicted = cache.addKey("c") # c:1. Evicts 'b'.
-assert evicted == "b"
-assert cache.getCountForKey("b") == 0
-assert "b" not in cache.items
-# State: {a:1, c:1}. Max is 'a' (a < c).
-assert cache.getMaxFrequencyKey() == "a"
-cache.addKey("c") # State: {a:1, c:2}. Max is 'c'.
-assert cache.getMaxFrequencyKey() == "c"
-print("Phase 4 Passed!")
-
-print("\n--- Additional Tests ---")
-c = FrequencyCache()
-assert c.getMaxFrequencyKey() == ""
-c.addKey(1)
-assert c.getMaxFrequencyKey() == 1
-c.addKey(2)
-# Default rule: 2 > 1
-assert c.getMaxFrequencyKey() == 2
-c.addKey(2)
-assert c.getMaxFrequencyKey() == 2
-c.addKey(3)
-# State {1:1, 2:2, 3:1}. Max is 2.
-assert c.getMaxFrequencyKey() == 2
-c.addKey(3)
-# State {1:1, 2:2, 3:2}. Max is 3 (3 > 2)
-assert c.getMaxFrequencyKey() == 3
-c.addKey(3)
-# State {1:1, 2:2, 3:3}. Max is 3.
-assert c.getMaxFrequencyKey() == 3
-c.addKey(1)
-c.addKey(1)
-# State {1:3, 2:2, 3:3}. Max is 3 (tie, 3 > 1)
-assert c.getMaxFrequencyKey() == 3
-c.addKey(1)
-# State {1:4, 2:2, 3:3}. Max is 1.
-assert c.getMaxFrequencyKey() == 1
-assert c.getCountForKey(1) == 4
-assert c.getCountForKey(2) == 2
-assert c.getCountForKey(3) == 3
-print("Additional Tests Passed!")
+    # Phase 2 & 3: Dynamic priority rule
+    print("\n--- Phase 2 & 3: Dynamic Priority ---")
+    cache = FrequencyCache()
+    cache.addKey("a")
+    cache.addKey("b")
+    # Default rule: b > a
+    assert cache.getMaxFrequencyKey() == "b"
+
+    # New rule: frequency desc, then key asc
+    def new_rule(item1, item2):
+        if item1.count != item2.count:
+            return item1.count > item2.count
+        return item1.key < item2.key # Note the '<'
+
+    cache.setPriorityRule(new_rule)
+    # Tie in count, 'a' < 'b' so 'a' has higher priority now
+    assert cache.getMaxFrequencyKey() == "a"
+    cache.addKey("b") # b count becomes 2
+    assert cache.getMaxFrequencyKey() == "b"
+    print("Phase 2 & 3 Passed!")
+
+    # Phase 4: Capacity limit
+    print("\n--- Phase 4: Capacity Limit ---")
+    # Use the new rule (key asc for ties)
+    cache = FrequencyCache(capacity=2)
+    cache.setPriorityRule(new_rule)
+    cache.addKey("a") # a:1
+    cache.addKey("b") # b:1, a:1 -> max is 'a' due to rule
+    assert cache.getMaxFrequencyKey() == "a"
+    # Add 'c', capacity is full.
+    # Eviction check: 'a' and 'b' have count 1. 'b' has lower priority (b > a).
+    # So 'b' should be evicted.
+    evicted = cache.addKey("c") # c:1. Evicts 'b'.
+    assert evicted == "b"
+    assert cache.getCountForKey("b") == 0
+    assert "b" not in cache.items
+    # State: {a:1, c:1}. Max is 'a' (a < c).
+    assert cache.getMaxFrequencyKey() == "a"
+    cache.addKey("c") # State: {a:1, c:2}. Max is 'c'.
+    assert cache.getMaxFrequencyKey() == "c"
+    print("Phase 4 Passed!")
+
+    print("\n--- Additional Tests ---")
+    c = FrequencyCache()
+    assert c.getMaxFrequencyKey() == ""
+    c.addKey(1)
+    assert c.getMaxFrequencyKey() == 1
+    c.addKey(2)
+    # Default rule: 2 > 1
+    assert c.getMaxFrequencyKey() == 2
+    c.addKey(2)
+    assert c.getMaxFrequencyKey() == 2
+    c.addKey(3)
+    # State {1:1, 2:2, 3:1}. Max is 2.
+    assert c.getMaxFrequencyKey() == 2
+    c.addKey(3)
+    # State {1:1, 2:2, 3:2}. Max is 3 (3 > 2)
+    assert c.getMaxFrequencyKey() == 3
+    c.addKey(3)
+    # State {1:1, 2:2, 3:3}. Max is 3.
+    assert c.getMaxFrequencyKey() == 3
+    c.addKey(1)
+    c.addKey(1)
+    # State {1:3, 2:2, 3:3}. Max is 3 (tie, 3 > 1)
+    assert c.getMaxFrequencyKey() == 3
+    c.addKey(1)
+    # State {1:4, 2:2, 3:3}. Max is 1.
+    assert c.getMaxFrequencyKey() == 1
+    assert c.getCountForKey(1) == 4
+    assert c.getCountForKey(2) == 2
+    assert c.getCountForKey(3) == 3
+    print("Additional Tests Passed!")
+
+    print("\n--- BucketFrequencyCache ---")
+    c = BucketFrequencyCache()
+    assert c.getMaxFrequencyKey() == ""
+    c.addKey("a")
+    c.addKey("b")
+    assert c.getMaxFrequencyKey() == "b"
+    c.addKey("a")
+    assert c.getMaxFrequencyKey() == "a"
+    assert c.getCountForKey("a") == 2
+    assert c.getCountForKey("c") == 0
+
+    c = BucketFrequencyCache(capacity=2)
+    c.addKey("b")
+    c.addKey("b")
+    c.addKey("a")
+    # Lowest priority is the smallest key among the lowest counts: 'a'.
+    assert c.addKey("c") == "a"
+    assert c.getCountForKey("a") == 0
+    assert c.getMaxFrequencyKey() == "b"
+
+    # Same answers as the heap-based FrequencyCache under the default rule.
+    rng = random.Random(7)
+    for capacity in (3, 10, sys.maxsize):
+        heap_cache = FrequencyCache(capacity)
+        bucket_cache = BucketFrequencyCache(capacity)
+        for _ in range(2000):
+            key = rng.randint(0, 30)
+            assert heap_cache.addKey(key) == bucket_cache.addKey(key)
+            assert heap_cache.getMaxFrequencyKey() == bucket_cache.getMaxFrequencyKey()
+            assert heap_cache.getCountForKey(key) == bucket_cache.getCountForKey(key)
+
+    # Eviction churn through the bucket of keys seen once keeps both heaps bounded.
+    churn = BucketFrequencyCache(capacity=100)
+    for i in range(20000):
+        churn.addKey(f"once{i}")
+        bucket = churn.head
+        assert max(len(bucket.low), len(bucket.high)) <= 2 * len(bucket.members) + 9
+    print("BucketFrequencyCache Passed!")
+
+    print("\n--- PriorityHeap: both ends with a custom rule ---")
+    def by_key_length(item1, item2):
+        if len(item1.key) != len(item2.key):
+            return len(item1.key) > len(item2.key)
+        if item1.count != item2.count:
+            return item1.count > item2.count
+        return item1.key < item2.key
+
+    def rank(item):
+        return (len(item.key), item.count, [-ord(ch) for ch in item.key])
+
+    rng = random.Random(11)
+    cache = FrequencyCache(capacity=8)
+    cache.setPriorityRule(by_key_length)
+    for _ in range(2000):
+        key = "x" * rng.randint(1, 4) + rng.choice("abc")
+        before = dict((k, item.count) for k, item in cache.items.items())
+        evicted = cache.addKey(key)
+        if evicted:
+            expected = min((Item(k, n) for k, n in before.items()), key=rank).key
+            assert evicted == expected, (evicted, expected)
+        assert cache.getMaxFrequencyKey() == max(cache.items.values(), key=rank).key
+        assert cache.heap.find_lowest_priority_item().key == min(cache.items.values(), key=rank).key
+    print("PriorityHeap Passed!")
+
+    print("\n--- Key-function priority rules ---")
+    cache = FrequencyCache()
+    cache.addKey("a")
+    cache.addKey("b")
+    assert cache.getMaxFrequencyKey() == "b"
+    # count desc, then key asc (for equal-length keys): negated characters rank smaller keys higher.
+    cache.setPriorityKey(lambda item: (item.count, [-ord(ch) for ch in item.key]))
+    assert cache.getMaxFrequencyKey() == "a"
+    cache.addKey("b")
+    assert cache.getMaxFrequencyKey() == "b"
+
+    # Rule-based and key-based caches agree, including on eviction.
+    rng = random.Random(3)
+    rule_cache = FrequencyCache(capacity=5)
+    rule_cache.setPriorityRule(default_priority_rule)
+    key_cache = FrequencyCache(capacity=5)
+    for _ in range(2000):
+        key = rng.randint(0, 20)
+        assert rule_cache.addKey(key) == key_cache.addKey(key)
+        assert rule_cache.getMaxFrequencyKey() == key_cache.getMaxFrequencyKey()
+    print("Key-function rules Passed!")
+
+    print("\n--- CountMinSketch rows are independent ---")
+    # Keys that share a counter in one row must not keep sharing counters in the
+    # other rows; otherwise depth > 1 buys nothing. Expected rate: 1 / width.
+    sketch = CountMinSketch(256, 4)
+    for keys in (range(5000), [f"k{i}" for i in range(5000)], [(i, "x") for i in range(5000)]):
+        by_first_row = defaultdict(list)
+        for key in keys:
+            indexes = sketch._indexes(key)
+            by_first_row[indexes[0]].append(indexes[1])
+        pairs = same_second_row = 0
+        for second_rows in by_first_row.values():
+            for a in range(len(second_rows)):
+                for b in range(a):
+                    pairs += 1
+                    same_second_row += second_rows[a] == second_rows[b]
+        assert same_second_row / pairs < 0.02, (keys[0], same_second_row / pairs)
+    print("CountMinSketch independence Passed!")
+
+    print("\n--- ApproximateFrequencyCache ---")
+    rng = random.Random(5)
+    approx = ApproximateFrequencyCache.from_error(epsilon=0.001, delta=0.01, heavy_hitters=50)
+    exact = {}
+    for _ in range(50000):
+        # Zipf-like stream over 20000 keys.
+        key = f"k{int(rng.paretovariate(1.2)) % 20000}"
+        exact[key] = exact.get(key, 0) + 1
+        approx.addKey(key)
+    bounds = approx.error_bounds()
+    assert bounds["total"] == 50000
+    for key, count in exact.items():
+        estimate = approx.getCountForKey(key)
+        assert count <= estimate <= count + bounds["count_error"] + 1, (key, count, estimate)
+    hottest = sorted(exact, key=exact.get, reverse=True)
+    assert approx.getMaxFrequencyKey() == hottest[0]
+    top = [key for key, _ in approx.top_k(5)]
+    assert top == hottest[:5], (top, hottest[:5])
+    assert all(key in approx.top.buckets for key in exact if exact[key] > bounds["heavy_hitter_threshold"])
+    assert len(approx.top) == 50
+    print("ApproximateFrequencyCache Passed!")
+
+    print("\n--- Time-decayed FrequencyCache ---")
+    now = [0.0]
+    decayed = FrequencyCache(capacity=2, half_life=10, clock=lambda: now[0])
+    for _ in range(8):
+        decayed.addKey("old")
+    assert decayed.getMaxFrequencyKey() == "old"
+    now[0] = 50.0  # five half-lives later, "old" is worth 8 / 32 = 0.25 hits
+    decayed.addKey("new")
+    assert decayed.getMaxFrequencyKey() == "new"
+    assert abs(decayed.getDecayedCountForKey("old") - 0.25) < 1e-9
+    assert decayed.getCountForKey("old") == 8  # raw counts are still kept
+    # Eviction also follows recent traffic: "old" goes, not the newer key.
+    now[0] = 51.0
+    assert decayed.addKey("newer") == "old"
+    # Crossing the renormalisation point keeps order and decayed counts.
+    now[0] = 10 * FrequencyCache.MAX_DECAY_EXPONENT + 60
+    decayed.addKey("new")
+    assert decayed.epoch == now[0]
+    assert decayed.getMaxFrequencyKey() == "new"
+    assert abs(decayed.getDecayedCountForKey("new") - 1.0) < 1e-9
+    print("Time-decayed FrequencyCache Passed!")
+
+    print("\n--- ConcurrentFrequencyCache ---")
+    concurrent = ConcurrentFrequencyCache(num_shards=8, flush_threshold=32)
+
+    def producer(seed):
+        rng = random.Random(seed)
+        for _ in range(5000):
+            concurrent.addKey(f"k{min(int(rng.paretovariate(1.0)), 200)}")
+
+    threads = [threading.Thread(target=producer, args=(seed,)) for seed in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    exact = {}
+    for seed in range(8):
+        rng = random.Random(seed)
+        for _ in range(5000):
+            key = f"k{min(int(rng.paretovariate(1.0)), 200)}"
+            exact[key] = exact.get(key, 0) + 1
+    for key, count in exact.items():
+        assert concurrent.getCountForKey(key) == count, key
+    expected_top = sorted(exact.items(), key=lambda kv: (kv[1], kv[0]), reverse=True)[:5]
+    assert concurrent.top_k(5) == expected_top
+    assert concurrent.getMaxFrequencyKey() == expected_top[0][0]
+    assert not concurrent._buffers  # finished producers' buffers were dropped
+
+    # Queries racing with flushes never leave a stale cached top behind.
+    def burst(n):
+        for i in range(3000):
+            concurrent.addKey(f"hot{n}" if i % 2 else "k1")
+
+    readers_done = threading.Event()
+
+    def reader():
+        while not readers_done.is_set():
+            concurrent.top_k(3)
+
+    query_thread = threading.Thread(target=reader)
+    query_thread.start()
+    threads = [threading.Thread(target=burst, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    readers_done.set()
+    query_thread.join()
+    exact["k1"] += 4 * 1500
+    for n in range(4):
+        exact[f"hot{n}"] = 1500
+    expected_top = sorted(exact.items(), key=lambda kv: (kv[1], kv[0]), reverse=True)[:3]
+    assert concurrent.top_k(3) == expected_top
+    print("ConcurrentFrequencyCache Passed!")
+
+    print("\n--- Snapshot and warm start ---")
+    import os
+    import tempfile
+
+    cache = FrequencyCache()
+    for key in ["a", "b", "a", "c", "a", "b", "d", "d", "d", "d"]:
+        cache.addKey(key)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cache.bin")
+        cache.save(path)
+        warm = FrequencyCache.load(path)
+        assert {k: i.count for k, i in warm.items.items()} == {"a": 3, "b": 2, "c": 1, "d": 4}
+        assert warm.getMaxFrequencyKey() == "d"
+        halved = FrequencyCache.load(path, decay=0.5)
+        assert {k: i.count for k, i in halved.items.items()} == {"a": 1, "b": 1, "d": 2}
+        trimmed = FrequencyCache.load(path, capacity=2)
+        assert set(trimmed.items) == {"d", "a"}
+    int_keys = FrequencyCache()
+    for key in [1, 2, 2, -3]:
+        int_keys.addKey(key)
+    restored = FrequencyCache()
+    restored.bulk_load(FrequencyCache.parse_snapshot(int_keys.snapshot()))
+    assert {k: i.count for k, i in restored.items.items()} == {1: 1, 2: 2, -3: 1}
+    # The bulk-built heaps behave exactly like incrementally built ones.
+    rng = random.Random(9)
+    pairs = [(f"k{i}", rng.randint(1, 50)) for i in range(500)]
+    bulk = FrequencyCache()
+    bulk.bulk_load(pairs)
+    assert bulk.getMaxFrequencyKey() == max(pairs, key=lambda kv: (kv[1], kv[0]))[0]
+    assert bulk.heap.find_lowest_priority_item().key == min(pairs, key=lambda kv: (kv[1], kv[0]))[0]
+    for key, _ in pairs[:100]:
+        bulk.addKey(key)
+    assert bulk.getMaxFrequencyKey() == max(bulk.items.values(), key=lambda item: (item.count, item.key)).key
+    print("Snapshot Passed!")
+
+    print("\n--- top_k and iteration ---")
+    rng = random.Random(13)
+    cache = FrequencyCache()
+    for _ in range(3000):
+        cache.addKey(f"k{int(rng.paretovariate(1.0)) % 300}")
+    expected = sorted(((i.key, i.count) for i in cache.items.values()), key=lambda kc: (kc[1], kc[0]), reverse=True)
+    heap_before = list(cache.heap.heap)
+    assert cache.top_k(10) == expected[:10]
+    assert cache.top_k(0) == []
+    assert list(cache.iter_by_priority()) == expected
+    assert cache.heap.heap == heap_before  # nothing was copied or popped
+    assert FrequencyCache().top_k(3) == []
+    print("top_k Passed!")
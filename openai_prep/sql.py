@@ -1,7 +1,377 @@
+import array
+import bisect
+import csv
+import functools
+import heapq
+import itertools
+import json
+import math
+import mmap
+import operator
+import os
+import pickle
+import re
+import sys
+import threading
+from collections import Counter, defaultdict
 
 
+OPERATORS = {'=': operator.eq, '<': operator.lt, '>': operator.gt}
 
-class Table:
+
+# ======================================================================================
+# Secondary indexes
+# ======================================================================================
+
+class HashIndex:
+    """value -> row ids (in insertion order). Answers '=' in O(1)."""
+    kind = 'hash'
+    operators = ('=',)
+
+    def __init__(self):
+        self.row_ids = defaultdict(list)
+
+    def add(self, value, row_id):
+        self.row_ids[value].append(row_id)
+
+    def add_many(self, pairs):
+        for value, row_id in pairs:
+            self.row_ids[value].append(row_id)
+
+    def estimate(self, op, value):
+        return len(self.row_ids.get(value, ()))
+
+    def lookup(self, op, value):
+        return self.row_ids.get(value, [])
+
+
+class SortedIndex:
+    """
+    Sorted lists of (value, row id) entries. Answers '=', '<' and '>' with
+    bisect in O(log n + k).
+    New entries go to a small sorted `delta` list that is merged into the
+    main list once it outgrows 8 * sqrt(n) entries, so a single-row insert
+    costs O(sqrt n) amortised instead of a copy of the whole index. Writers
+    never modify either list in place: they publish a new (entries, delta)
+    pair in one assignment, so a reader that grabbed `state` keeps a
+    consistent view while inserts continue.
+    Only values that order against each other can be indexed. Once a value
+    of another kind arrives (say a string in a column of ints, or next to the
+    0 that a missing value defaults to), the index stops answering queries
+    and the planner scans instead.
+    """
+    kind = 'sorted'
+    operators = ('=', '<', '>')
+
+    _value = operator.itemgetter(0)
+
+    def __init__(self):
+        self.state = ([], [])  # (entries, delta), both sorted
+        self.family = None  # see _family; None until the first value
+
+    @property
+    def entries(self):
+        """All entries, merged. O(n): for inspection, not for queries."""
+        entries, delta = self.state
+        return list(heapq.merge(entries, delta))
+
+    @staticmethod
+    def _family(value):
+        """Values of one family compare with each other; ints and floats are one family."""
+        return float if isinstance(value, (int, float)) else type(value)
+
+    def _admit(self, values):
+        """Whether `values` can join the index; disables the index if not."""
+        if not self.operators:
+            return False
+        families = {self._family(value) for value in values}
+        if self.family is not None:
+            families.add(self.family)
+        if len(families) > 1:
+            self._disable()
+            return False
+        if families:
+            self.family = families.pop()
+        return True
+
+    def _disable(self):
+        # The published state is left alone: it still answers correctly for
+        # readers that already chose this index, whose rows all predate this.
+        self.operators = ()
+
+    def add(self, value, row_id):
+        if not self._admit((value,)):
+            return
+        entries, delta = self.state
+        delta = delta[:]
+        try:
+            bisect.insort(delta, (value, row_id))
+        except TypeError:  # a family that does not order itself, e.g. dicts
+            return self._disable()
+        self._publish(entries, delta)
+
+    def add_many(self, pairs):
+        pairs = list(pairs)
+        if not self._admit([value for value, _ in pairs]):
+            return
+        entries, delta = self.state
+        try:
+            self._publish(entries, sorted(itertools.chain(delta, pairs)))
+        except TypeError:
+            self._disable()
+
+    def _publish(self, entries, delta):
+        if len(delta) > max(64, 8 * math.isqrt(len(entries))):
+            # Both lists are sorted runs, so this is a merge for timsort.
+            self.state = (sorted(itertools.chain(entries, delta)), [])
+        else:
+            self.state = (entries, delta)
+
+    @classmethod
+    def _range(cls, entries, op, value):
+        if op == '=':
+            return (bisect.bisect_left(entries, value, key=cls._value),
+                    bisect.bisect_right(entries, value, key=cls._value))
+        if op == '<':
+            return 0, bisect.bisect_left(entries, value, key=cls._value)
+        return bisect.bisect_right(entries, value, key=cls._value), len(entries)
+
+    def estimate(self, op, value):
+        estimate = 0
+        for entries in self.state:
+            lo, hi = self._range(entries, op, value)
+            estimate += hi - lo
+        return estimate
+
+    def lookup(self, op, value):
+        row_ids = []
+        for entries in self.state:
+            lo, hi = self._range(entries, op, value)
+            row_ids.extend(row_id for _, row_id in entries[lo:hi])
+        # Back to insertion order, which is what a table scan returns.
+        row_ids.sort()
+        return row_ids
+
+    def ordered_ids(self, reverse=False):
+        """
+        Lazily yields every row id in value order, ties in insertion order
+        (the order a stable sort would produce, also when reversed).
+        """
+        entries, delta = self.state
+        if not reverse:
+            return (row_id for _, row_id in heapq.merge(entries, delta))
+        merged = heapq.merge(reversed(entries), reversed(delta), reverse=True)
+        groups = itertools.groupby(merged, key=self._value)
+        return (row_id for _, group in groups for _, row_id in reversed(list(group)))
+
+
+INDEX_KINDS = {'hash': HashIndex, 'sorted': SortedIndex}
+
+
+class IndexedTableMixin:
+    """
+    Index maintenance, planning and snapshots shared by Table and ColumnarTable.
+    Subclasses provide `column_values(i)` (all values of column i, in row order)
+    and `watermark`.
+
+    Concurrency (MVCC over an append-only table): writers serialise on
+    `write_lock` and append a whole batch, indexes included, before advancing
+    `watermark`, the number of committed rows. Readers take no lock: they pin
+    a watermark when a query starts (or pass an older one as `as_of`) and
+    ignore every row at or past it, so they never see a partial batch and
+    never block writers.
+    """
+
+    def snapshot(self):
+        """The current watermark; pass it as `as_of` to read this version of the table later."""
+        return self.watermark
+
+    def create_index(self, column, kind='hash'):
+        if kind not in INDEX_KINDS:
+            raise ValueError(f"unknown index kind {kind!r}")
+        with self.write_lock:
+            index = INDEX_KINDS[kind]()
+            index.add_many(zip(self.column_values(self.column_names[column]), itertools.count()))
+            # Publish a new dict rather than mutating one that readers may be iterating.
+            indexes = {name: dict(by_kind) for name, by_kind in self.indexes.items()}
+            indexes.setdefault(column, {})[kind] = index
+            self.indexes = indexes
+        return index
+
+    def _index_row(self, row, row_id):
+        """Adds a newly inserted row (a dict) to every index."""
+        for column, by_kind in self.indexes.items():
+            value = row.get(column, 0)
+            for index in by_kind.values():
+                index.add(value, row_id)
+
+    def _index_rows(self, tuples, first_row_id):
+        """Adds newly inserted rows (tuples in column order) to every index."""
+        for column, by_kind in self.indexes.items():
+            i = self.column_names[column]
+            for index in by_kind.values():
+                index.add_many((row[i], row_id) for row_id, row in enumerate(tuples, first_row_id))
+
+    def _as_tuples(self, rows):
+        """
+        Normalises dicts (missing columns default to 0) and tuples/lists (all
+        columns, in table order) to tuples in column order.
+        """
+        names = list(self.column_names)
+        tuples = []
+        for row in rows:
+            if isinstance(row, dict):
+                for k in row:
+                    if k not in self.column_names:
+                        raise KeyError(k)
+                tuples.append(tuple(row.get(name, 0) for name in names))
+            elif len(row) == self.N:
+                tuples.append(tuple(row))
+            else:
+                raise ValueError(f"expected {self.N} values, got {len(row)}: {row!r}")
+        return tuples
+
+    def _plan(self, conditions, as_of=None):
+        """
+        Picks the usable index with the fewest estimated matches.
+        Returns (candidate row ids or None for a full scan, remaining conditions,
+        the chosen (column, kind, op) or None). Candidates are limited to rows
+        before `as_of` when it is given.
+        """
+        best = None
+        for n, (k, o, v) in enumerate(conditions):
+            for kind, index in self.indexes.get(k, {}).items():
+                if o in index.operators:
+                    try:
+                        estimate = index.estimate(o, v)
+                    except TypeError:
+                        # v does not order against the indexed values (WHERE
+                        # id = '3' on ints); the scan decides what that means.
+                        continue
+                    if best is None or estimate < best[0]:
+                        best = (estimate, n, index, kind)
+        if best is None:
+            return None, conditions, None
+        _, n, index, kind = best
+        k, o, v = conditions[n]
+        remaining = conditions[:n] + conditions[n + 1:]
+        try:
+            candidate_ids = index.lookup(o, v)
+        except TypeError:  # as above, if the index gained its first values since
+            return None, conditions, None
+        if as_of is not None:
+            candidate_ids = [row_id for row_id in candidate_ids if row_id < as_of]
+        return candidate_ids, remaining, (k, kind, o)
+
+    def _ordered_ids(self, orderby, reverse, as_of=None):
+        """Row ids in ORDER BY order from a sorted index, or None if there is no such index."""
+        if orderby and len(orderby) == 1:
+            index = self.indexes.get(orderby[0], {}).get('sorted')
+            if index is not None and index.operators:
+                ordered_ids = index.ordered_ids(reverse)
+                if as_of is not None:
+                    ordered_ids = (row_id for row_id in ordered_ids if row_id < as_of)
+                return ordered_ids
+        return None
+
+    def explain(self, conditions):
+        """Describes how `conditions` would be evaluated."""
+        _, remaining, chosen = self._plan(conditions or [])
+        if chosen is None:
+            return 'full scan'
+        column, kind, op = chosen
+        return f'{kind} index on {column} ({op}), then filter {len(remaining)} condition(s)'
+
+
+# ======================================================================================
+# Query compilation
+# ======================================================================================
+
+_COMPARISONS = {'=': '==', '<': '<', '>': '>'}
+
+
+def compile_query(column_names, cols, condition_shape, orderby=None, reverse=False, limited=False, lazy=False):
+    """
+    Generates a function `run(rows, params, start=0, stop=None)` for one query
+    shape: the filter, the sort and the projection with every column index
+    resolved up front. `condition_shape` is a list of (column, op); `params`
+    holds the compared values in the same order, so one compiled query serves
+    every value. If `limited`, only result rows [start, stop) are produced: an
+    ORDER BY keeps the top `stop` rows in a heap instead of sorting everything.
+    If `lazy`, the result is a generator instead of a list; only the sort buffers rows.
+    """
+    tests = []
+    for n, (k, o) in enumerate(condition_shape):
+        if o not in _COMPARISONS:
+            raise ValueError(f"unsupported operator {o!r}")
+        tests.append(f'row[{column_names[k]}] {_COMPARISONS[o]} p{n}')
+    where = f' if {" and ".join(tests)}' if tests else ''
+    projection = f'[{", ".join(f"row[{column_names[col]}]" for col in cols)}]'
+    result = '({} for row in {})' if lazy else '[{} for row in {}]'
+
+    lines = ['def run(rows, params, start=0, stop=None):']
+    if tests:
+        lines.append(f'    {"".join(f"p{n}, " for n in range(len(tests)))}= params')
+    if orderby and limited:
+        top = 'nlargest' if reverse else 'nsmallest'
+        lines.append(f'    rows = {top}(stop, (row for row in rows{where}), key=order_key)')
+        lines.append(f'    return {result.format(projection, "islice(rows, start, None)")}')
+    elif orderby:
+        lines.append(f'    rows = sorted([row for row in rows{where}], key=order_key, reverse={bool(reverse)})')
+        lines.append(f'    return {result.format(projection, "rows")}')
+    elif limited:
+        lines.append(f'    return {result.format(projection, f"islice((row for row in rows{where}), start, stop)")}')
+    else:
+        # No sort: filter and project in a single pass.
+        lines.append(f'    return {result.format(projection, f"rows{where}")}')
+
+    namespace = {
+        'order_key': operator.itemgetter(*[column_names[name] for name in orderby]) if orderby else None,
+        'nsmallest': heapq.nsmallest,
+        'nlargest': heapq.nlargest,
+        'islice': itertools.islice,
+    }
+    exec('\n'.join(lines), namespace)
+    return namespace['run']
+
+
+class Cursor:
+    """
+    The result rows of a query, produced on demand by the table's generator
+    pipeline (scan, filter, project). Fetching in batches keeps memory
+    proportional to the batch size. Only an ORDER BY buffers the filtered
+    rows, or their ids in a columnar table, which also lists the candidates
+    of an index lookup up front.
+    """
+    arraysize = 100  # default fetchmany() batch size
+
+    def __init__(self, rows, arraysize=None):
+        self._rows = iter(rows)
+        if arraysize is not None:
+            self.arraysize = arraysize
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._rows)
+
+    def fetchone(self):
+        """The next row, or None when the result is exhausted."""
+        return next(self._rows, None)
+
+    def fetchmany(self, size=None):
+        """Up to `size` (default: arraysize) next rows; an empty list when exhausted."""
+        return list(itertools.islice(self._rows, size or self.arraysize))
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def close(self):
+        self._rows = iter(())
+
+
+class Table(IndexedTableMixin):
 
     def __init__(self, col_names) -> None:
         self.column_names = {}
@@ -11,70 +381,128 @@ class Table:
             self.column_names[column_name] = i
 
         self.N = len(self.column_names)
+        self.indexes = {}  # column -> {kind: index}
+        self.compiled = {}  # query shape -> compile_query() function
+        self.watermark = 0  # rows [0, watermark) are committed (see IndexedTableMixin)
+        self.write_lock = threading.Lock()
+
+    def column_values(self, i):
+        return [row[i] for row in self.rows]
 
     def insert(self, row):
 
         row_list = [0] * self.N
-        print('inserting row into table:', row)
         for k in row:
-            v = row[k]
-            print(k, v)
-            i = self.column_names[k]
-            row_list[i] = v
+            row_list[self.column_names[k]] = row[k]
+
+        with self.write_lock:
+            self.rows.append(row_list)
+            if self.indexes:
+                self._index_row(row, len(self.rows) - 1)
+            self.watermark = len(self.rows)
 
-        self.rows.append(row_list)
+    def insert_many(self, rows):
+        """Inserts an iterable of dicts or tuples (see _as_tuples) as one committed batch."""
+        tuples = self._as_tuples(rows)
+        with self.write_lock:
+            first_row_id = len(self.rows)
+            self.rows.extend(map(list, tuples))
+            if self.indexes:
+                self._index_rows(tuples, first_row_id)
+            self.watermark = len(self.rows)
 
-    def query_raw(self, cols):
+    def query_raw(self, cols, as_of=None):
         column_indexes  = [self.column_names[col] for col in cols]
         ans = []
-        for row in self.rows:
+        for row in itertools.islice(self.rows, self.watermark if as_of is None else as_of):
             ans_row = [row[i] for i in column_indexes]
             ans.append(ans_row)
 
         return ans
 
-    def query(self, cols, conditions=None, orderby=None,reverse=False):
-        rows = self.rows
-        print('   -query with condition', rows, conditions)
+    def compile(self, cols, condition_shape=(), orderby=None, reverse=False, limited=False, lazy=False):
+        """The compiled function for a query shape, generated once and then reused."""
+        shape = (tuple(cols), tuple(condition_shape), tuple(orderby) if orderby else None, bool(reverse),
+                 limited, lazy)
+        run = self.compiled.get(shape)
+        if run is None:
+            run = self.compiled[shape] = compile_query(self.column_names, *shape)
+        return run
+
+    def query(self, cols, conditions=None, orderby=None,reverse=False, limit=None, offset=0, as_of=None):
+        return self._execute(cols, conditions, orderby, reverse, limit, offset, as_of, lazy=False)
+
+    def cursor(self, cols, conditions=None, orderby=None, reverse=False, limit=None, offset=0, arraysize=None,
+               as_of=None):
+        """
+        Like query(), but returns a Cursor that produces the rows lazily. The
+        cursor reads the snapshot pinned when it was opened.
+        """
+        return Cursor(self._execute(cols, conditions, orderby, reverse, limit, offset, as_of, lazy=True), arraysize)
+
+    def aggregate(self, group_columns, aggregates, conditions=None, as_of=None):
+        """
+        GROUP BY `group_columns` with `aggregates`, a list of (func, column)
+        where func is one of AGGREGATE_STEPS (column '*' for count). One row per
+        group, in first-seen order: the group values, then the aggregates.
+        Hash aggregation in a single pass over the filtered rows.
+        """
+        _check_aggregates(aggregates)
+        num_groups = len(group_columns)
+        needed = list(group_columns) + [column for _, column in aggregates if column != '*']
+        steps = []
+        position = num_groups
+        for func, column in aggregates:
+            steps.append((AGGREGATE_STEPS[func][1], 0 if column == '*' else position))
+            position += column != '*'
+        initial = [AGGREGATE_STEPS[func][0] for func, _ in aggregates]
+
+        groups = {}
+        for row in self._execute(needed or [next(iter(self.column_names))], conditions, None, False, None, 0, as_of,
+                                 lazy=True):
+            key = tuple(row[:num_groups])
+            state = groups.get(key)
+            if state is None:
+                state = groups[key] = list(initial)
+            for n, (step, i) in enumerate(steps):
+                state[n] = step(state[n], row[i])
+
+        if not groups and not group_columns:
+            return _empty_aggregate(aggregates)
+        return [list(key) + [_finish_aggregate(func, value) for (func, _), value in zip(aggregates, state)]
+                for key, state in groups.items()]
+
+    def _execute(self, cols, conditions, orderby, reverse, limit, offset, as_of, lazy):
+        if as_of is None:
+            as_of = self.watermark
+        rows = itertools.islice(self.rows, as_of)
+        candidate_ids = None
 
         if conditions != None:
-            ans = []
-
-            for row in rows:
-                satisfy = True
-                for cond in conditions:
-                    k, o, v = cond
-                    i = self.column_names[k]
-                    print('   -kov', k,o,v,i,row[i])
-
-                    if o == '=':
-                        if row[i] != v:
-                            satisfy = False
-                    elif o == '<':
-                        if not row[i] < v:
-                            satisfy = False
-                    elif o == '>':
-                        if not row[i] > v:
-                            satisfy = False
-                if satisfy:
-                    ans.append(row)
-
-            rows = ans
-
-        if orderby != None:
-            order_index = [self.column_names[name] for name in orderby]
-            rows = sorted(rows, key=lambda x: [x[i] for i in order_index], reverse=reverse)
-            print('    -sorted: ', rows)
-
-        print('rows after condition', rows)
+            candidate_ids, conditions, _ = self._plan(conditions, as_of)
+            if candidate_ids is not None:
+                rows = map(self.rows.__getitem__, candidate_ids)
+        else:
+            conditions = []
 
-        column_indexes  = [self.column_names[col] for col in cols]
-        ans = []
-        for row in rows:
-            ans_row = [row[i] for i in column_indexes]
-            ans.append(ans_row)
+        limited = limit is not None or offset > 0
+        stop = offset + limit if limit is not None else None
+        if limited and candidate_ids is None:
+            ordered_ids = self._ordered_ids(orderby, reverse, as_of)
+            if ordered_ids is not None:
+                # Walk a sorted index in ORDER BY order and stop after `stop` matches.
+                rows = map(self.rows.__getitem__, ordered_ids)
+                orderby = None
+        if limited and orderby and stop is None:
+            limited = False  # OFFSET without LIMIT needs the full sort anyway
 
-        return ans
+        run = self.compile(cols, [(k, o) for k, o, _ in conditions], orderby, reverse, limited, lazy)
+        if limited:
+            return run(rows, [v for _, _, v in conditions], offset, stop)
+        rows = run(rows, [v for _, _, v in conditions])
+        if offset:
+            return itertools.islice(rows, offset, None) if lazy else rows[offset:]
+        return rows
 
 
 
@@ -86,20 +514,974 @@ class Table:
     #     pass
 
 
+# ======================================================================================
+# Columnar storage
+# ======================================================================================
+
+def _and_masks(mask1, mask2):
+    """ANDs two selection bitmaps (one 0/1 byte per row) as big integers, at C speed."""
+    n = len(mask1)
+    return (int.from_bytes(mask1, 'little') & int.from_bytes(mask2, 'little')).to_bytes(n, 'little')
+
+
+def _rows_between(values, start, stop):
+    """values[start:stop] as an iterable. Only a chunk from the middle is copied, never a whole column."""
+    return itertools.islice(values, stop) if not start else values[start:stop]
+
+
+def _map_array(path, typecode, n, swap):
+    """
+    A read-only view of `n` values of type `typecode` stored in `path`,
+    memory-mapped so that only the pages actually read are loaded. Files
+    written on a machine of the other byte order are read and byte-swapped.
+    """
+    if n == 0 or swap:
+        values = array.array(typecode)
+        with open(path, 'rb') as f:
+            values.frombytes(f.read())
+        if swap:
+            values.byteswap()
+    else:
+        with open(path, 'rb') as f:
+            # The mapping stays open for as long as the memoryview references it.
+            values = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)).cast(typecode)
+    if len(values) != n:
+        raise ValueError(f"{path}: expected {n} values, found {len(values)}")
+    return values
+
+
+class ObjectColumn:
+    """A column of arbitrary Python values, stored in a list."""
+    KIND = 'object'
+    mapped = False  # True while backed by a read-only memory-mapped file (see writable())
+
+    def __init__(self, values=()):
+        self.values = list(values)
+
+    def save(self, path, n):
+        """Writes the first `n` values to `path` plus an extension for this column type."""
+        with open(path + '.pickle', 'wb') as f:
+            pickle.dump(list(itertools.islice(self.values, n)), f)
+
+    @classmethod
+    def load(cls, path, n, swap=False):
+        # Only load files you trust: this unpickles arbitrary objects.
+        with open(path + '.pickle', 'rb') as f:
+            values = pickle.load(f)
+        if len(values) != n:
+            raise ValueError(f"{path}: expected {n} values, found {len(values)}")
+        return cls(values)
+
+    def writable(self):
+        """This column, or an in-memory copy of it if it is memory-mapped."""
+        return self
+
+    @staticmethod
+    def accepts(value):
+        return True
+
+    def append(self, value):
+        self.values.append(value)
+
+    def extend(self, values):
+        self.values.extend(values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, i):
+        return self.values[i]
+
+    def take(self, row_ids):
+        """The values at `row_ids`, in that order."""
+        return list(map(self.values.__getitem__, row_ids))
+
+    def to_list(self):
+        return list(self.values)
+
+    def mask(self, op, value, stop, start=0):
+        """Evaluates `row op value` for rows start..stop-1 into a selection bitmap."""
+        return bytes(map(OPERATORS[op], _rows_between(self.values, start, stop), itertools.repeat(value)))
+
+
+class IntColumn(ObjectColumn):
+    """64-bit integers in a typed array: 8 bytes per value instead of a pointer to an int object."""
+    TYPECODE = 'q'
+    KIND = 'int64'
+
+    def __init__(self, values=()):
+        self.values = array.array(self.TYPECODE, values)
+
+    def save(self, path, n):
+        # Raw native-order values: the file can be mapped straight back into memory.
+        # Slicing copies, so the live array never exports its buffer (which
+        # would make a concurrent writer's append fail with BufferError).
+        with open(f'{path}.{self.KIND}', 'wb') as f:
+            f.write(self.values[:n])
+
+    @classmethod
+    def load(cls, path, n, swap=False):
+        column = cls.__new__(cls)
+        column.values = _map_array(f'{path}.{cls.KIND}', cls.TYPECODE, n, swap)
+        column.mapped = type(column.values) is memoryview
+        return column
+
+    def writable(self):
+        if not self.mapped:
+            return self
+        return type(self)(array.array(self.TYPECODE, self.values.tobytes()))
+
+    @staticmethod
+    def accepts(value):
+        return type(value) is int and -2**63 <= value < 2**63
+
+
+class FloatColumn(IntColumn):
+    TYPECODE = 'd'
+    KIND = 'float64'
+
+    @staticmethod
+    def accepts(value):
+        # Not ints: they would come back as floats (3 -> 3.0) and Table keeps them as ints.
+        return type(value) is float
+
+
+class DictEncodedColumn(ObjectColumn):
+    """
+    Strings stored as integer codes into a dictionary of distinct values.
+    A predicate is evaluated once per distinct string, then mapped over the codes.
+    """
+
+    KIND = 'dict'
+
+    def __init__(self, values=()):
+        self.codes = array.array('I')
+        self.dictionary = []
+        self.code_of = {}
+        for value in values:
+            self.append(value)
+
+    def save(self, path, n):
+        """Codes as raw native-order uint32 values, the dictionary as JSON alongside."""
+        with open(path + '.codes', 'wb') as f:
+            f.write(self.codes[:n])  # a copy: see IntColumn.save
+        with open(path + '.dict.json', 'w') as f:
+            json.dump(self.dictionary[:], f)
+
+    @classmethod
+    def load(cls, path, n, swap=False):
+        column = cls.__new__(cls)
+        column.codes = _map_array(path + '.codes', 'I', n, swap)
+        column.mapped = type(column.codes) is memoryview
+        with open(path + '.dict.json') as f:
+            column.dictionary = json.load(f)
+        column.code_of = {value: code for code, value in enumerate(column.dictionary)}
+        return column
+
+    def writable(self):
+        if not self.mapped:
+            return self
+        column = DictEncodedColumn()
+        column.codes = array.array('I', self.codes.tobytes())
+        column.dictionary = list(self.dictionary)
+        column.code_of = dict(self.code_of)
+        return column
+
+    @staticmethod
+    def accepts(value):
+        return type(value) is str
+
+    def append(self, value):
+        code = self.code_of.get(value)
+        if code is None:
+            code = self.code_of[value] = len(self.dictionary)
+            self.dictionary.append(value)
+        self.codes.append(code)
+
+    def extend(self, values):
+        code_of, dictionary = self.code_of, self.dictionary
+        for value in values:
+            if value not in code_of:
+                code_of[value] = len(dictionary)
+                dictionary.append(value)
+        self.codes.extend(map(code_of.__getitem__, values))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, i):
+        return self.dictionary[self.codes[i]]
+
+    def take(self, row_ids):
+        return list(map(self.dictionary.__getitem__, map(self.codes.__getitem__, row_ids)))
+
+    def to_list(self):
+        return list(map(self.dictionary.__getitem__, self.codes))
+
+    def mask(self, op, value, stop, start=0):
+        codes = _rows_between(self.codes, start, stop)
+        if op == '=':
+            code = self.code_of.get(value)
+            if code is None:
+                return bytes(stop - start)
+            return bytes(map(code.__eq__, codes))
+        matching = bytes(map(OPERATORS[op], self.dictionary, itertools.repeat(value)))
+        return bytes(map(matching.__getitem__, codes))
+
+
+COLUMN_KINDS = {cls.KIND: cls for cls in (ObjectColumn, IntColumn, FloatColumn, DictEncodedColumn)}
+
+
+def _column_for(value):
+    """Picks the most compact column type able to hold `value`."""
+    for column_cls in (IntColumn, FloatColumn, DictEncodedColumn):
+        if column_cls.accepts(value):
+            return column_cls()
+    return ObjectColumn()
+
+
+class ColumnarTable(IndexedTableMixin):
+    """
+    A column-oriented table with the same API as Table.
+
+    Each column is stored separately, typed by its first value: ints and floats
+    in `array` vectors, strings dictionary-encoded, anything else in a list. A
+    column becomes an object column if a later value does not fit, ints mixed
+    with floats included, so every value comes back with the type it went in.
+    WHERE conditions are evaluated one column at a time into selection
+    bitmaps that are ANDed together, and only the selected rows of the
+    projected columns are materialised.
+
+    `num_rows` is the watermark: columns may briefly be longer while a batch
+    is being appended, and readers only look at the first `num_rows` values.
+    A widened column is a new object, so readers holding the old one are unaffected.
+    """
+
+    SCAN_CHUNK = 4096  # rows per condition pass when a cursor streams its matches
+
+    def __init__(self, col_names) -> None:
+        self.column_names = {}
+        for i, column_name in enumerate(col_names):
+            self.column_names[column_name] = i
+        self.N = len(self.column_names)
+        self.columns = [None] * self.N  # created on first insert, typed by the first value
+        self.num_rows = 0
+        self.indexes = {}  # column -> {kind: index}
+        self.write_lock = threading.Lock()
+
+    @property
+    def watermark(self):
+        return self.num_rows
+
+    def column_values(self, i):
+        column = self.columns[i]
+        return column.to_list() if column is not None else []
+
+    def __len__(self):
+        return self.num_rows
+
+    def _append(self, i, value):
+        column = self.columns[i]
+        if column is not None and column.mapped:
+            # Copy on write: the mapped file itself is never modified.
+            column = self.columns[i] = column.writable()
+        if column is None:
+            column = self.columns[i] = _column_for(value)
+        elif not column.accepts(value):
+            column = self.columns[i] = ObjectColumn(column.to_list())
+        column.append(value)
+
+    def _extend(self, i, values):
+        column = self.columns[i]
+        if column is not None and column.mapped:
+            column = self.columns[i] = column.writable()
+        if column is None:
+            column = self.columns[i] = _column_for(values[0])
+        if not all(map(column.accepts, values)):
+            column = self.columns[i] = ObjectColumn(column.to_list())
+        column.extend(values)
+
+    def insert(self, row):
+        for k in row:
+            if k not in self.column_names:
+                raise KeyError(k)
+        with self.write_lock:
+            for name, i in self.column_names.items():
+                # Columns missing from the row default to 0, as in Table.
+                self._append(i, row.get(name, 0))
+            if self.indexes:
+                self._index_row(row, self.num_rows)
+            self.num_rows += 1
+
+    def insert_many(self, rows):
+        """
+        Inserts an iterable of dicts or tuples (see _as_tuples), appending
+        column by column, as one committed batch.
+        """
+        tuples = self._as_tuples(rows)
+        if not tuples:
+            return
+        with self.write_lock:
+            for i, values in enumerate(zip(*tuples)):
+                self._extend(i, values)
+            if self.indexes:
+                self._index_rows(tuples, self.num_rows)
+            self.num_rows += len(tuples)
+
+    def select(self, conditions=None, as_of=None):
+        """Row ids matching all conditions, in insertion order."""
+        if as_of is None:
+            as_of = self.num_rows
+        if not conditions:
+            return range(as_of)
+        if not as_of:
+            return []  # nothing committed yet: columns may not exist
+        candidate_ids, conditions, _ = self._plan(conditions, as_of)
+        if candidate_ids is not None:
+            return self._filter_candidates(candidate_ids, conditions)
+        return list(itertools.compress(range(as_of), self._mask(conditions, 0, as_of)))
+
+    def _filter_candidates(self, candidate_ids, conditions):
+        """Few candidates (from an index): check the remaining conditions row by row."""
+        for k, o, v in conditions:
+            column, op = self.columns[self.column_names[k]], OPERATORS[o]
+            candidate_ids = [i for i in candidate_ids if op(column[i], v)]
+        return candidate_ids
+
+    def _mask(self, conditions, start, stop):
+        """The AND of every condition's bitmap over rows start..stop-1."""
+        mask = None
+        for k, o, v in conditions:
+            if o not in OPERATORS:
+                raise ValueError(f"unsupported operator {o!r}")
+            column_mask = self.columns[self.column_names[k]].mask(o, v, stop, start)
+            mask = column_mask if mask is None else _and_masks(mask, column_mask)
+        return mask
+
+    def _scan_ids(self, conditions, as_of, chunk_size):
+        """
+        Like select(), but an iterator that evaluates the conditions `chunk_size`
+        rows at a time, so no list of every match is built. Candidates from an
+        index, when the planner picks one, are still listed up front.
+        """
+        if not conditions or not as_of:
+            return iter(range(as_of) if not conditions else ())
+        candidate_ids, conditions, _ = self._plan(conditions, as_of)
+        if candidate_ids is not None:
+            return iter(self._filter_candidates(candidate_ids, conditions))
+        for _, o, _ in conditions:  # fail now, not on the first fetch
+            if o not in OPERATORS:
+                raise ValueError(f"unsupported operator {o!r}")
+        return (row_id
+                for start in range(0, as_of, chunk_size)
+                for row_id in itertools.compress(range(start, min(start + chunk_size, as_of)),
+                                                 self._mask(conditions, start, min(start + chunk_size, as_of))))
+
+    def project(self, row_ids, cols):
+        """Materialises rows `row_ids` restricted to `cols`, column by column."""
+        column_indexes = [self.column_names[col] for col in cols]
+        if not row_ids:
+            return []  # columns do not exist before the first insert
+        values = [self.columns[i].take(row_ids) for i in column_indexes]
+        return [list(row) for row in zip(*values)]
+
+    def query_raw(self, cols, as_of=None):
+        return self.project(range(self.num_rows if as_of is None else as_of), cols)
+
+    def query(self, cols, conditions=None, orderby=None, reverse=False, limit=None, offset=0, as_of=None):
+        return self.project(self._result_ids(conditions, orderby, reverse, limit, offset, as_of), cols)
+
+    def cursor(self, cols, conditions=None, orderby=None, reverse=False, limit=None, offset=0, arraysize=None,
+               as_of=None):
+        """
+        Like query(), but returns a Cursor. Without ORDER BY, the conditions are
+        evaluated and rows materialised one chunk of rows at a time as they are
+        fetched. With one, the matching row ids are computed up front (one
+        bitmap pass per condition) and rows are materialised `arraysize` at a time.
+        """
+        arraysize = arraysize or Cursor.arraysize
+        if orderby is None:
+            as_of = self.num_rows if as_of is None else as_of
+            stop = offset + limit if limit is not None else None
+            chunk_size = max(arraysize, self.SCAN_CHUNK)
+            row_ids = itertools.islice(self._scan_ids(conditions, as_of, chunk_size), offset, stop)
+        else:
+            row_ids = self._result_ids(conditions, orderby, reverse, limit, offset, as_of)
+        return Cursor(self._project_batches(row_ids, cols, arraysize), arraysize)
+
+    def aggregate(self, group_columns, aggregates, conditions=None, as_of=None):
+        """
+        Same result as Table.aggregate. Rows are grouped once, then each
+        aggregate column is gathered in group order and every group's slice is
+        reduced by a builtin (len/sum/min/max) rather than row by row.
+        """
+        _check_aggregates(aggregates)
+        row_ids = self.select(conditions, as_of)
+        if not row_ids:
+            return [] if group_columns else _empty_aggregate(aggregates)
+        if not group_columns:
+            keys, bounds, sorted_ids = [()], [0, len(row_ids)], row_ids
+        else:
+            group_of = {}
+            keys = zip(*[self.columns[self.column_names[name]].take(row_ids) for name in group_columns])
+            group_ids = [group_of.setdefault(key, len(group_of)) for key in keys]
+            keys = list(group_of)
+            counts = Counter(group_ids)
+            bounds = [0] + list(itertools.accumulate(counts[g] for g in range(len(keys))))
+            # Stable sort: each group's rows become one contiguous run, in row order.
+            sorted_ids = list(map(row_ids.__getitem__, sorted(range(len(row_ids)), key=group_ids.__getitem__)))
+
+        results = [list(key) for key in keys]
+        for func, column in aggregates:
+            reduce = AGGREGATE_REDUCERS[func]
+            values = sorted_ids if column == '*' else self.columns[self.column_names[column]].take(sorted_ids)
+            for g, result in enumerate(results):
+                result.append(_finish_aggregate(func, reduce(values[bounds[g]:bounds[g + 1]])))
+        return results
+
+    def _project_batches(self, row_ids, cols, batch_size):
+        row_ids = iter(row_ids)
+        for batch in iter(lambda: list(itertools.islice(row_ids, batch_size)), []):
+            yield from self.project(batch, cols)
+
+    def _result_ids(self, conditions, orderby, reverse, limit, offset, as_of=None):
+        if as_of is None:
+            as_of = self.num_rows
+        stop = offset + limit if limit is not None else None
+        ordered_ids = self._ordered_ids(orderby, reverse, as_of) if stop is not None and not conditions else None
+        if ordered_ids is not None:
+            # A sorted index already yields rows in ORDER BY order: take the page directly.
+            return list(itertools.islice(ordered_ids, offset, stop))
+
+        row_ids = self.select(conditions, as_of)
+        if orderby != None and row_ids:
+            order_columns = [self.columns[self.column_names[name]] for name in orderby]
+            if len(order_columns) == 1:
+                key = order_columns[0].__getitem__
+            else:
+                key = lambda i: tuple(column[i] for column in order_columns)
+            if stop is not None:
+                row_ids = (heapq.nlargest if reverse else heapq.nsmallest)(stop, row_ids, key=key)
+            else:
+                row_ids = sorted(row_ids, key=key, reverse=reverse)
+        return row_ids[offset:stop]
+
+
+# ======================================================================================
+# Persistence
+# ======================================================================================
+
+TABLE_FORMAT = 1
+
+_COLUMN_FILE = re.compile(r'\d+(\.g\d+)?\.')
+
+
+def _column_prefix(path, i, generation):
+    return os.path.join(path, str(i) if generation is None else f'{i}.g{generation}')
+
+
+def save_table(table, path, as_of=None):
+    """
+    Saves a row or columnar table, as of a snapshot (default: now), to the
+    directory `path`: one contiguous file per column (see the column types'
+    save()) and meta.json. Values load back with the Python type they were
+    inserted with: a column mixing types (3 next to 2.5, say) is pickled.
+    Every save writes a new generation of column files and then switches
+    meta.json to it atomically, so a partial save is never loaded and files
+    that a loaded table has memory-mapped are never overwritten (saving a
+    loaded table back to its own directory is safe). Files of older
+    generations are deleted afterwards; existing mappings keep their data.
+    Indexes are not saved; create them again after loading.
+    """
+    n = table.snapshot() if as_of is None else as_of
+    if not isinstance(table, ColumnarTable):
+        columnar = ColumnarTable(table.column_names)
+        columnar.insert_many(itertools.islice(table.rows, n))
+        table = columnar
+    os.makedirs(path, exist_ok=True)
+    generation = 1
+    if os.path.exists(os.path.join(path, 'meta.json')):
+        with open(os.path.join(path, 'meta.json')) as f:
+            generation = json.load(f).get('generation', 0) + 1
+    kinds = []
+    for i, column in enumerate(table.columns):
+        if column is not None:
+            column.save(_column_prefix(path, i, generation), n)
+        kinds.append(column.KIND if column is not None else None)
+    meta = {'format': TABLE_FORMAT, 'columns': list(table.column_names), 'kinds': kinds,
+            'num_rows': n, 'byteorder': sys.byteorder, 'generation': generation}
+    with open(os.path.join(path, 'meta.json.tmp'), 'w') as f:
+        json.dump(meta, f)
+    os.replace(os.path.join(path, 'meta.json.tmp'), os.path.join(path, 'meta.json'))
+
+    current = tuple(os.path.basename(_column_prefix(path, i, generation)) + '.' for i in range(len(kinds)))
+    for name in os.listdir(path):
+        if _COLUMN_FILE.match(name) and not name.startswith(current):
+            os.remove(os.path.join(path, name))
+
+
+def load_table(path) -> ColumnarTable:
+    """
+    Opens a table saved by save_table. Numeric columns and string codes are
+    memory-mapped, so opening is fast whatever the size and pages are read
+    on first access. Inserting into a mapped column copies it into memory first.
+    """
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    if meta['format'] != TABLE_FORMAT:
+        raise ValueError(f"{path}: unsupported table format {meta['format']}")
+    swap = meta['byteorder'] != sys.byteorder
+    table = ColumnarTable(meta['columns'])
+    for i, kind in enumerate(meta['kinds']):
+        if kind is not None:
+            prefix = _column_prefix(path, i, meta.get('generation'))
+            table.columns[i] = COLUMN_KINDS[kind].load(prefix, meta['num_rows'], swap)
+    table.num_rows = meta['num_rows']
+    return table
+
+
+# ======================================================================================
+# Joins and aggregation
+# ======================================================================================
+
+def hash_join(left, right, on, left_cols, right_cols, how='inner', left_as_of=None, right_as_of=None):
+    """
+    Equi-joins two tables (row or columnar). Builds a hash table of `right`'s
+    join keys, then probes it with each `left` row, so the output follows
+    `left`'s row order. `on` is a list of (left column, right column) pairs.
+    With how='left', unmatched left rows get None for the right columns.
+    Each table is read at one snapshot (its current one by default).
+    """
+    if how not in ('inner', 'left'):
+        raise ValueError(f"unsupported join type {how!r}")
+    left_keys = [l for l, _ in on]
+    right_keys = [r for _, r in on]
+    left_as_of = left.snapshot() if left_as_of is None else left_as_of
+    right_as_of = right.snapshot() if right_as_of is None else right_as_of
+
+    build = defaultdict(list)  # join key -> right row ids
+    for row_id, key in enumerate(right.query_raw(right_keys, right_as_of)):
+        build[tuple(key)].append(row_id)
+
+    right_rows = right.query_raw(right_cols, right_as_of)
+    missing = [None] * len(right_cols)
+    ans = []
+    for left_row, key in zip(left.query_raw(left_cols, left_as_of), left.query_raw(left_keys, left_as_of)):
+        matches = build.get(tuple(key))
+        if matches:
+            for row_id in matches:
+                ans.append(left_row + right_rows[row_id])
+        elif how == 'left':
+            ans.append(left_row + missing)
+    return ans
+
+
+def _qualified_join(tables, watermarks, left_table, right_table, on, select_columns, how):
+    """hash_join with 'table.column' select names, in the requested order (see InMemDb.join)."""
+    if left_table == right_table:
+        # 'emp.name' could mean either side; call hash_join(t, t, ...) with a column list per side.
+        raise ValueError(f"cannot self-join {left_table!r} by name; use hash_join")
+    left, right = tables[left_table], tables[right_table]
+    sides = {left_table: [], right_table: []}
+    for qualified in select_columns:
+        table_name, column = qualified.split('.', 1)
+        if table_name not in sides:
+            raise KeyError(qualified)
+        sides[table_name].append(column)
+    rows = hash_join(left, right, on, sides[left_table], sides[right_table], how,
+                     watermarks.get(left_table), watermarks.get(right_table))
+    # hash_join puts left columns first: restore the requested column order.
+    position = {}
+    for n, column in enumerate(sides[left_table]):
+        position.setdefault(f'{left_table}.{column}', n)
+    for n, column in enumerate(sides[right_table]):
+        position.setdefault(f'{right_table}.{column}', len(sides[left_table]) + n)
+    order = [position[qualified] for qualified in select_columns]
+    if order == sorted(order):
+        return rows
+    return [[row[i] for i in order] for row in rows]
+
+
+# name -> (initial state, step(state, value)); see _finish_aggregate
+AGGREGATE_STEPS = {
+    'count': (0, lambda state, value: state + 1),
+    'sum': (0, operator.add),
+    'min': (None, lambda state, value: value if state is None or value < state else state),
+    'max': (None, lambda state, value: value if state is None or value > state else state),
+    'avg': ((0, 0), lambda state, value: (state[0] + value, state[1] + 1)),
+}
+
+# name -> reduction over all of a group's values at once
+AGGREGATE_REDUCERS = {
+    'count': len,
+    'sum': sum,
+    'min': min,
+    'max': max,
+    'avg': lambda values: (sum(values), len(values)),
+}
+
+
+def _finish_aggregate(func, state):
+    if func == 'avg':
+        total, count = state
+        return total / count if count else None
+    return state
+
+
+def _check_aggregates(aggregates):
+    for func, _ in aggregates:
+        if func not in AGGREGATE_STEPS:
+            raise ValueError(f"unsupported aggregate {func!r}")
+
+
+def _empty_aggregate(aggregates):
+    """SQL semantics: aggregating no rows without GROUP BY still returns one row."""
+    return [[_finish_aggregate(func, AGGREGATE_STEPS[func][0]) for func, _ in aggregates]]
+
+
+# ======================================================================================
+# SQL front-end
+# ======================================================================================
+
+class SQLSyntaxError(ValueError):
+    pass
+
+
+class Param:
+    """A `?` placeholder: the `index`-th value of the params passed to execute()."""
+
+    def __init__(self, index):
+        self.index = index
+
+    def __repr__(self):
+        return f'Param({self.index})'
+
+
+class QueryPlan:
+    """
+    The logical plan of one SELECT: which table, projection, conditions
+    (values may be Params), order by, and limit/offset. `columns` is None
+    for SELECT *. Plans are shared through the parse cache, so they are
+    never modified after parsing.
+    """
+
+    def __init__(self, table, columns, conditions, order_by, reverse, limit, offset):
+        self.table = table
+        self.columns = columns
+        self.conditions = conditions
+        self.order_by = order_by
+        self.reverse = reverse
+        self.limit = limit
+        self.offset = offset
+
+    def bind(self, params):
+        """The conditions with placeholders replaced by `params`."""
+        bound = []
+        for k, o, v in self.conditions:
+            if isinstance(v, Param):
+                if v.index >= len(params):
+                    raise ValueError(f"query needs at least {v.index + 1} params, got {len(params)}")
+                v = params[v.index]
+            bound.append([k, o, v])
+        return bound
+
+    def execute(self, db, params=(), as_of=None):
+        table = db.tables[self.table]
+        columns = list(table.column_names) if self.columns is None else list(self.columns)
+        conditions = self.bind(params) if self.conditions else None
+        order_by = list(self.order_by) if self.order_by else None
+        return table.query(columns, conditions, order_by, self.reverse, self.limit, self.offset, as_of)
+
+
+_TOKEN = re.compile(r"""\s*(?:
+    (?P<number>-?(?:\d+\.\d*|\.\d+|\d+))
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<name>[A-Za-z_][A-Za-z_0-9]*)
+  | (?P<symbol>[*,=<>?])
+)""", re.VERBOSE)
+
+_KEYWORDS = {'SELECT', 'FROM', 'WHERE', 'AND', 'ORDER', 'BY', 'ASC', 'DESC', 'LIMIT', 'OFFSET'}
+
+
+def _tokenize(text):
+    tokens = []
+    position = 0
+    text = text.strip().rstrip(';')
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if match is None or match.end() == position:
+            raise SQLSyntaxError(f"unexpected character at {position}: {text[position:position + 10]!r}")
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'name' and value.upper() in _KEYWORDS:
+            kind, value = 'keyword', value.upper()
+        tokens.append((kind, value))
+        position = match.end()
+    return tokens
+
+
+class _Parser:
+    """Recursive descent over SELECT cols FROM t [WHERE ...] [ORDER BY ...] [LIMIT n [OFFSET m]]."""
+
+    def __init__(self, text):
+        self.tokens = _tokenize(text)
+        self.position = 0
+        self.num_params = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def accept(self, kind, value=None):
+        token_kind, token_value = self.peek()
+        if token_kind == kind and (value is None or token_value == value):
+            self.position += 1
+            return token_value
+        return None
+
+    def expect(self, kind, value=None):
+        token = self.accept(kind, value)
+        if token is None:
+            raise SQLSyntaxError(f"expected {value or kind}, got {self.peek()[1]!r}")
+        return token
+
+    def parse(self):
+        self.expect('keyword', 'SELECT')
+        if self.accept('symbol', '*'):
+            columns = None
+        else:
+            columns = self.names()
+        self.expect('keyword', 'FROM')
+        table = self.expect('name')
+
+        conditions = []
+        if self.accept('keyword', 'WHERE'):
+            conditions.append(self.condition())
+            while self.accept('keyword', 'AND'):
+                conditions.append(self.condition())
+
+        order_by, reverse = None, False
+        if self.accept('keyword', 'ORDER'):
+            self.expect('keyword', 'BY')
+            order_by, directions = [], set()
+            while True:
+                order_by.append(self.expect('name'))
+                directions.add(self.accept('keyword', 'DESC') or self.accept('keyword', 'ASC') or 'ASC')
+                if not self.accept('symbol', ','):
+                    break
+            if len(directions) > 1:
+                raise SQLSyntaxError("mixed ASC/DESC in ORDER BY is not supported")
+            reverse = directions == {'DESC'}
+            order_by = tuple(order_by)
+
+        limit, offset = None, 0
+        if self.accept('keyword', 'LIMIT'):
+            limit = self.count()
+            if self.accept('keyword', 'OFFSET'):
+                offset = self.count()
+
+        if self.position != len(self.tokens):
+            raise SQLSyntaxError(f"unexpected {self.peek()[1]!r}")
+        return QueryPlan(table, columns, tuple(conditions), order_by, reverse, limit, offset)
+
+    def names(self):
+        names = [self.expect('name')]
+        while self.accept('symbol', ','):
+            names.append(self.expect('name'))
+        return tuple(names)
+
+    def condition(self):
+        column = self.expect('name')
+        kind, op = self.peek()
+        if kind != 'symbol' or op not in OPERATORS:
+            raise SQLSyntaxError(f"expected one of {' '.join(OPERATORS)}, got {op!r}")
+        self.position += 1
+        return (column, op, self.value())
+
+    def value(self):
+        if self.accept('symbol', '?'):
+            self.num_params += 1
+            return Param(self.num_params - 1)
+        number = self.accept('number')
+        if number is not None:
+            return float(number) if '.' in number else int(number)
+        string = self.accept('string')
+        if string is not None:
+            return string[1:-1].replace("''", "'")
+        raise SQLSyntaxError(f"expected a value, got {self.peek()[1]!r}")
+
+    def count(self):
+        number = self.expect('number')
+        if not number.isdigit():
+            raise SQLSyntaxError(f"expected a non-negative integer, got {number!r}")
+        return int(number)
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_sql(text) -> QueryPlan:
+    """Parses a SELECT into a QueryPlan. Cached by query text: use `?` params to share plans."""
+    return _Parser(text).parse()
+
+
+def _parse_csv_value(text):
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+class Snapshot:
+    """
+    A consistent, read-only view of every table in an InMemDb, pinned at the
+    watermarks current when InMemDb.snapshot() was called. Inserts made
+    afterwards, including tables created afterwards, are invisible to it.
+    """
+
+    def __init__(self, tables):
+        self.tables = dict(tables)
+        self.watermarks = {name: table.snapshot() for name, table in self.tables.items()}
+
+    def query_king(self, table_name, select_columns, conditions=None, order_by=None, reverse=False,
+                   limit=None, offset=0):
+        return self.tables[table_name].query(select_columns, conditions, order_by, reverse, limit, offset,
+                                             self.watermarks[table_name])
+
+    def cursor(self, table_name, select_columns, conditions=None, order_by=None, reverse=False,
+               limit=None, offset=0, arraysize=None):
+        return self.tables[table_name].cursor(select_columns, conditions, order_by, reverse, limit, offset,
+                                              arraysize, self.watermarks[table_name])
+
+    def execute(self, sql, params=()):
+        plan = parse_sql(sql)
+        return plan.execute(self, params, self.watermarks[plan.table])
+
+    def group_by(self, table_name, group_columns, aggregates, conditions=None):
+        return self.tables[table_name].aggregate(group_columns, aggregates, conditions, self.watermarks[table_name])
+
+    def join(self, left_table, right_table, on, select_columns, how='inner'):
+        return _qualified_join(self.tables, self.watermarks, left_table, right_table, on, select_columns, how)
+
+
 class InMemDb:
 
-    def __init__(self):
+    STORAGE = {'row': Table, 'columnar': ColumnarTable}
+
+    def __init__(self, storage='row'):
+        """
+        storage: 'row' (lists per row) or 'columnar' (see ColumnarTable).
+        Safe for concurrent use: writers serialise per table, readers never
+        block (see IndexedTableMixin); use snapshot() for reads across queries.
+        """
+        if storage not in self.STORAGE:
+            raise ValueError(f"unknown storage {storage!r}")
+        self.table_class = self.STORAGE[storage]
         self.tables = {}
+        self._create_lock = threading.Lock()
+
+    def _table(self, tablename, columns):
+        """The table called `tablename`, created with `columns` if it does not exist yet."""
+        table = self.tables.get(tablename)
+        if table is None:
+            with self._create_lock:
+                table = self.tables.get(tablename)
+                if table is None:
+                    table = self.tables[tablename] = self.table_class(columns)
+        return table
+
+    def snapshot(self):
+        """Pins the current version of every table; see Snapshot."""
+        return Snapshot(self.tables)
+
+    def save(self, directory):
+        """Saves every table, at one snapshot, to `directory/<table name>/` (see save_table)."""
+        snapshot = self.snapshot()
+        for name, table in snapshot.tables.items():
+            save_table(table, os.path.join(directory, name), snapshot.watermarks[name])
+
+    def load(self, directory):
+        """
+        Adds every table saved in `directory`. Columnar databases keep the
+        columns memory-mapped; row databases read them into rows.
+        """
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if not os.path.exists(os.path.join(path, 'meta.json')):
+                continue
+            table = load_table(path)
+            if self.table_class is not ColumnarTable:
+                rows = table.query_raw(list(table.column_names))
+                table = self.table_class(table.column_names)
+                table.insert_many(rows)
+            self.tables[name] = table
 
     def insert(self, tablename, rows):
-        if tablename not in self.tables:
-            self.tables[tablename] = Table(rows.keys())
+        self._table(tablename, rows.keys()).insert(rows)
+
+    def insert_many(self, tablename, rows, columns=None, chunk_size=10000):
+        """
+        Inserts an iterable of dicts or tuples, `chunk_size` rows at a time, so
+        generators are consumed without materialising them. A new table takes
+        its columns from `columns` or else from the first row (which must then be a dict).
+        """
+        rows = iter(rows)
+        for chunk in iter(lambda: list(itertools.islice(rows, chunk_size)), []):
+            table = self.tables.get(tablename) or self._table(tablename, columns or chunk[0].keys())
+            table.insert_many(chunk)
 
-        self.tables[tablename].insert(rows)
+    def load_csv(self, tablename, path, converters=None, chunk_size=10000):
+        """
+        Streams a CSV file with a header row into `tablename`. Values are
+        converted by `converters` (column -> callable) or else parsed as int,
+        then float, falling back to the string.
+        """
+        with open(path, newline='') as f:
+            reader = csv.reader(f)
+            columns = next(reader)
+            parse = [(converters or {}).get(column, _parse_csv_value) for column in columns]
+            rows = (tuple(p(value) for p, value in zip(parse, row)) for row in reader if row)
+            self.insert_many(tablename, rows, columns, chunk_size)
+
+    def load_jsonl(self, tablename, path, chunk_size=10000):
+        """Streams a file of one JSON object per line into `tablename`."""
+        with open(path) as f:
+            rows = (json.loads(line) for line in f if line.strip())
+            self.insert_many(tablename, rows, chunk_size=chunk_size)
 
     def query(self, table_name: str, columns:list[str]):
         return self.tables[table_name].query(columns)
 
+    def cursor(self, table_name, select_columns, conditions=None, order_by=None, reverse=False,
+               limit=None, offset=0, arraysize=None):
+        """query_king() as a Cursor: rows are produced lazily, use fetchmany() to read them in batches."""
+        return self.tables[table_name].cursor(select_columns, conditions, order_by, reverse, limit, offset, arraysize)
+
+    def join(self, left_table, right_table, on, select_columns, how='inner'):
+        """
+        Hash join (see hash_join). `on` pairs columns as [(left column, right column), ...];
+        `select_columns` are 'table.column' names from either table, so the two
+        tables must differ (ValueError otherwise; self-joins go through hash_join).
+        """
+        return _qualified_join(self.tables, {}, left_table, right_table, on, select_columns, how)
+
+    def execute(self, sql, params=()):
+        """
+        Runs a SELECT, e.g.
+            db.execute("SELECT name FROM users WHERE id > ? ORDER BY name DESC LIMIT 10", [100])
+        Parsing is cached by query text and compiled queries by shape.
+        """
+        return parse_sql(sql).execute(self, params)
+
+    def group_by(self, table_name, group_columns, aggregates, conditions=None):
+        """e.g. group_by('orders', ['user_id'], [('count', '*'), ('sum', 'amount')])."""
+        return self.tables[table_name].aggregate(group_columns, aggregates, conditions)
+
+    def create_index(self, table_name, column, kind='hash'):
+        """Builds a 'hash' (equality) or 'sorted' (equality and range) index, maintained on insert."""
+        return self.tables[table_name].create_index(column, kind)
+
 
     def query_with_where(self, table_name, select_columns, conditions):
         return self.tables[table_name].query(select_columns, conditions)
@@ -108,42 +1490,398 @@ class InMemDb:
                            order_by_columns: list, reverse: bool = False):
         return self.tables[table_name].query(select_columns, orderby=order_by_columns, reverse=reverse)
 
-    def query_king(self, table_name, select_columns, conditions=None, order_by=None, reverse=False):
-        return self.tables[table_name].query(select_columns, conditions, order_by, reverse)
+    def query_king(self, table_name, select_columns, conditions=None, order_by=None, reverse=False,
+                   limit=None, offset=0):
+        return self.tables[table_name].query(select_columns, conditions, order_by, reverse, limit, offset)
+
+
+if __name__ == "__main__":
+    import random
+    import tempfile
+
+    db = InMemDb()
+
+    db.insert('users', {'id': 101, 'name': 'Alice'})
+    db.insert('users', {'id': 102, 'name': 'Bob'})
+    db.insert('users', {'id': 103, 'name': 'Charlie'})
+
+    ans = db.query('users', ['id'])
+
+    print('1. Naive insert + query\n   ', ans)
+
+
+    print('-'*80)
+    ans = db.query_with_where('users', ['name'], [['id', '=', 102]])
+    print('2.a where\n   ', ans)
+
+    ans = db.query_with_where('users', ['name'], [['id', '>', 102]])
+    print('2.b where\n   ', ans)
+
+    ans = db.query_with_where('users', ['name'], [['id', '<', 102]])
+    print('2.c where\n   ', ans)
+
+
+    print('-'*80)
+    ans = db.query_with_order_by('users', ['name'], order_by_columns=['name'], reverse=False)
+    print('3.a order by', ans)
+    ans = db.query_with_order_by('users', ['name'], order_by_columns=['name'], reverse=True)
+    print('3.b order by', ans)
+
+
+
+
+    print('-'*80)
+    ans = db.query_king('users', ['name'], conditions=[['id', '<', 103]], order_by=['name'], reverse=True)
+    print('4 where and order by', ans)
+
+
+    print('-'*80)
+    cdb = InMemDb(storage='columnar')
+    for row in [{'id': 101, 'name': 'Alice', 'score': 3},
+                {'id': 102, 'name': 'Bob', 'score': 2.5},
+                {'id': 103, 'name': 'Charlie', 'score': 1},
+                {'id': 104, 'name': 'Bob', 'score': 4}]:
+        cdb.insert('users', row)
+    users = cdb.tables['users']
+    assert [type(c).__name__ for c in users.columns] == ['IntColumn', 'DictEncodedColumn', 'ObjectColumn']
+    # Ints next to floats stay ints, as in a row table (3 == 3.0, so compare types).
+    assert [list(map(type, row)) for row in cdb.query('users', ['score'])] == [[int], [float], [int], [int]]
+    fdb = InMemDb(storage='columnar')
+    fdb.insert_many('f', [(0.5,), (1.5,)], columns=['x'])
+    assert type(fdb.tables['f'].columns[0]).__name__ == 'FloatColumn'
+    fdb.insert('f', {'x': 3})
+    assert type(fdb.tables['f'].columns[0]).__name__ == 'ObjectColumn'
+    assert [type(x) for [x] in fdb.query('f', ['x'])] == [float, float, int]
+    assert users.columns[1].dictionary == ['Alice', 'Bob', 'Charlie']
+    for storage_db in (db, cdb):
+        assert storage_db.query('users', ['id'])[:3] == [[101], [102], [103]]
+        assert storage_db.query_with_where('users', ['name'], [['id', '=', 102]]) == [['Bob']]
+        assert storage_db.query_with_where('users', ['name'], [['id', '<', 102]]) == [['Alice']]
+        assert storage_db.query_king('users', ['name'], conditions=[['id', '<', 103]], order_by=['name'], reverse=True) == [['Bob'], ['Alice']]
+    assert cdb.query_with_where('users', ['id'], [['name', '=', 'Bob'], ['score', '>', 3]]) == [[104]]
+    assert cdb.query_with_where('users', ['id'], [['name', '>', 'B']]) == [[102], [103], [104]]
+    assert cdb.query_with_where('users', ['id'], [['name', '=', 'Nobody']]) == []
+    assert cdb.query_king('users', ['id', 'score'], order_by=['name', 'score']) == [[101, 3], [102, 2.5], [104, 4], [103, 1]]
+    cdb.insert('users', {'id': 105, 'name': 'Dan', 'score': 'n/a'})  # widens score to an object column
+    assert type(users.columns[2]).__name__ == 'ObjectColumn'
+    assert cdb.query_with_where('users', ['score'], [['id', '>', 104]]) == [['n/a']]
+    for huge in (2**63 + 1, 2**64 + 3):
+        hdb = InMemDb(storage='columnar')
+        hdb.insert('h', {'id': 1} if huge < 2**64 else {'id': huge})
+        hdb.insert_many('h', [(huge,)])
+        assert type(hdb.tables['h'].columns[0]).__name__ == 'ObjectColumn'
+        assert hdb.query_with_where('h', ['id'], [['id', '=', huge]]) == [[huge]] * (1 if huge < 2**64 else 2)
+    hdb = InMemDb(storage='columnar')
+    hdb.insert('h', {'x': 2**60 + 1})
+    hdb.insert('h', {'x': 0.5})  # 2**60 + 1 is not exact as a float
+    assert hdb.query('h', ['x']) == [[2**60 + 1], [0.5]] and type(hdb.tables['h'].columns[0]).__name__ == 'ObjectColumn'
+    for storage in ('row', 'columnar'):
+        empty = InMemDb(storage=storage).table_class(['a', 'b'])
+        assert empty.query(['a']) == empty.query(['a'], [['a', '=', 1]]) == empty.query(['b'], orderby=['a']) == []
+        assert empty.aggregate(['a'], [('count', '*')]) == [] and empty.aggregate([], [('count', '*')]) == [[0]]
+        assert empty.cursor(['a']).fetchall() == []
+    print('5 columnar storage passed')
+
+
+    print('-'*80)
+    for storage in ('row', 'columnar'):
+        idb = InMemDb(storage=storage)
+        for i in range(1000):
+            idb.insert('t', {'id': i, 'bucket': i % 10, 'name': f'n{i % 7}'})
+        before = [idb.query_with_where('t', ['id'], c) for c in ([['id', '=', 500]], [['id', '>', 995]], [['bucket', '=', 3], ['id', '<', 40]])]
+        idb.create_index('t', 'id', kind='sorted')
+        idb.create_index('t', 'bucket', kind='hash')
+        t = idb.tables['t']
+        assert t.explain([['id', '=', 500]]) == 'sorted index on id (=), then filter 0 condition(s)'
+        # The planner prefers the more selective index: id < 40 matches 40 rows, bucket = 3 matches 100.
+        assert t.explain([['bucket', '=', 3], ['id', '<', 40]]) == 'sorted index on id (<), then filter 1 condition(s)'
+        assert t.explain([['name', '=', 'n1']]) == 'full scan'
+        after = [idb.query_with_where('t', ['id'], c) for c in ([['id', '=', 500]], [['id', '>', 995]], [['bucket', '=', 3], ['id', '<', 40]])]
+        assert before == after == [[[500]], [[996], [997], [998], [999]], [[3], [13], [23], [33]]]
+        idb.insert('t', {'id': 2000, 'bucket': 3, 'name': 'late'})  # indexes are maintained on insert
+        assert idb.query_with_where('t', ['name'], [['id', '>', 1500]]) == [['late']]
+        assert idb.query_with_where('t', ['id'], [['bucket', '=', 3], ['id', '>', 990]]) == [[993], [2000]]
+        for i in range(1500, 1000, -1):  # single inserts go through the delta list and several merges
+            idb.insert('t', {'id': i, 'bucket': i % 10, 'name': 'single'})
+        index = t.indexes['id']['sorted']
+        assert [value for value, _ in index.entries] == sorted(row[0] for row in t.query_raw(['id']))
+        assert idb.query_with_where('t', ['id'], [['id', '>', 1495]]) == [[2000], [1500], [1499], [1498], [1497], [1496]]
+        assert idb.query_king('t', ['id'], order_by=['id'], reverse=True, limit=3) == [[2000], [1500], [1499]]
+        # A value that does not order against the indexed ones gets a scan's answer.
+        assert idb.query_with_where('t', ['id'], [['id', '=', '3']]) == []
+        # Missing labels default to 0, which does not order against strings.
+        idb.insert_many('m', [{'id': 1, 'label': 'b'}, {'id': 2}, {'id': 3, 'label': 'a'}])
+        labels = idb.create_index('m', 'label', kind='sorted')
+        assert idb.tables['m'].explain([['label', '=', 'a']]) == 'full scan'
+        assert idb.query_with_where('m', ['id'], [['label', '=', 'a']]) == [[3]]
+        idb.insert('m', {'id': 4, 'label': 'a'})
+        assert idb.query_with_where('m', ['id'], [['label', '=', 'a']]) == [[3], [4]]
+        idb.create_index('t', 'name', kind='sorted')
+        idb.insert('t', {'id': 3000, 'name': 7})  # disables the index from now on
+        assert t.explain([['name', '=', 'late']]) == 'full scan'
+        assert idb.query_with_where('t', ['id'], [['name', '=', 7]]) == [[3000]]
+        assert not labels.operators and t.indexes['id']['sorted'].operators
+    print('6 secondary indexes passed')
+
+
+    print('-'*80)
+    ctable = Table(['id', 'name', 'score'])
+    ctable.insert_many([(1, 'a', 5), (2, 'b', 3), (3, 'a', 4), (4, 'c', 3)])
+    assert ctable.query(['id'], [['score', '<', 5]], orderby=['score', 'name'], reverse=True) == [[3], [4], [2]]
+    assert ctable.query(['name'], [['score', '<', 4]]) == [['b'], ['c']]
+    assert ctable.query(['name'], [['score', '<', 5]]) == [['b'], ['a'], ['c']]  # same shape, new value
+    assert len(ctable.compiled) == 2
+    assert ctable.query(['name', 'id'], orderby=['id'], reverse=True)[0] == ['c', 4]
+    try:
+        ctable.query(['id'], [['score', '!=', 1]])
+        assert False
+    except ValueError:
+        pass
+    print('7 compiled queries passed')
+
+
+    print('-'*80)
+    rng = random.Random(0)
+    page_rows = [{'id': i, 'score': rng.randrange(50), 'group': rng.choice('xyz')} for i in range(500)]
+    for storage in ('row', 'columnar'):
+        for indexed in (False, True):
+            pdb = InMemDb(storage=storage)
+            for row in page_rows:
+                pdb.insert('t', row)
+            if indexed:
+                pdb.create_index('t', 'score', kind='sorted')
+            for conditions in (None, [['group', '=', 'x']]):
+                for order_by in (['score'], ['score', 'id']):
+                    for reverse in (False, True):
+                        full = pdb.query_king('t', ['id', 'score'], conditions, order_by, reverse)
+                        for limit, offset in ((10, 0), (7, 30), (1000, 490), (0, 5)):
+                            page = pdb.query_king('t', ['id', 'score'], conditions, order_by, reverse, limit, offset)
+                            assert page == full[offset:offset + limit], (storage, indexed, conditions, order_by, reverse, limit, offset)
+                        assert pdb.query_king('t', ['id'], conditions, order_by, reverse, offset=495) == [r[:1] for r in full[495:]]
+            assert pdb.query_king('t', ['id'], limit=3, offset=2) == [[2], [3], [4]]
+    print('8 limit/offset passed')
+
+
+    print('-'*80)
+    for storage in ('row', 'columnar'):
+        pdb = InMemDb(storage=storage)
+        for row in page_rows:
+            pdb.insert('t', row)
+        for args in ((None, None), ([['group', '=', 'y']], None), ([['score', '>', 10]], ['score', 'id'])):
+            expected = pdb.query_king('t', ['id', 'score'], *args)
+            cursor = pdb.cursor('t', ['id', 'score'], *args, arraysize=64)
+            batches = iter(cursor.fetchmany, [])
+            assert [row for batch in batches for row in batch] == expected
+            assert cursor.fetchone() is None and cursor.fetchmany() == []
+        cursor = pdb.cursor('t', ['id'], [['score', '<', 25]], limit=5, offset=1)
+        assert cursor.fetchone() == pdb.query_king('t', ['id'], [['score', '<', 25]])[1]
+        assert len(cursor.fetchmany(2)) == 2 and len(cursor.fetchall()) == 2
+        assert list(pdb.cursor('t', ['id'], order_by=['id'], reverse=True, limit=2)) == [[499], [498]]
+    # The row pipeline is a generator: nothing is scanned until rows are fetched,
+    # but the cursor only sees the rows committed when it was opened.
+    lazy_table = Table(['x'])
+    lazy_table.insert_many([(1,), (2,), (3,)])
+    lazy_cursor = lazy_table.cursor(['x'], [['x', '>', 1]])
+    lazy_table.insert({'x': 4})
+    assert lazy_cursor.fetchall() == [[2], [3]]
+    # Without ORDER BY, a columnar cursor evaluates its conditions a chunk of rows at a time.
+    streamed = InMemDb(storage='columnar')
+    for row in page_rows:
+        streamed.insert('t', row)
+    chunked = streamed.tables['t']
+    chunked.SCAN_CHUNK = 7
+    for conditions, limit, offset in ((None, None, 0), ([['group', '=', 'y']], None, 0),
+                                      ([['score', '>', 10], ['group', '<', 'z']], 20, 5), ([['id', '>', 1000]], None, 0)):
+        expected = chunked.query(['id', 'group'], conditions, limit=limit, offset=offset)
+        assert chunked.cursor(['id', 'group'], conditions, limit=limit, offset=offset, arraysize=3).fetchall() == expected
+    passes = []
+    chunked._mask = lambda conditions, start, stop: passes.append(start) or ColumnarTable._mask(chunked, conditions, start, stop)
+    streaming = chunked.cursor(['id'], [['score', '>', -1]], arraysize=7)
+    assert streaming.fetchmany() == [[i] for i in range(7)] and passes == [0]
+    print('9 cursors passed')
 
 
-db = InMemDb()
+    print('-'*80)
+    for storage in ('row', 'columnar'):
+        jdb = InMemDb(storage=storage)
+        for row in [{'id': 1, 'name': 'Alice'}, {'id': 2, 'name': 'Bob'}, {'id': 3, 'name': 'Carol'}]:
+            jdb.insert('users', row)
+        for row in [{'order_id': 10, 'user_id': 1, 'amount': 5}, {'order_id': 11, 'user_id': 2, 'amount': 7},
+                    {'order_id': 12, 'user_id': 1, 'amount': 3}, {'order_id': 13, 'user_id': 9, 'amount': 1}]:
+            jdb.insert('orders', row)
+        assert jdb.join('users', 'orders', [('id', 'user_id')], ['users.name', 'orders.amount']) == \
+            [['Alice', 5], ['Alice', 3], ['Bob', 7]]
+        assert jdb.join('users', 'orders', [('id', 'user_id')], ['orders.order_id', 'users.name'], how='left') == \
+            [[10, 'Alice'], [12, 'Alice'], [11, 'Bob'], [None, 'Carol']]
+        jdb.insert_many('emp', [(1, 'Ann', 0), (2, 'Ben', 1), (3, 'Cy', 1)], columns=['id', 'name', 'mgr'])
+        try:
+            jdb.join('emp', 'emp', [('mgr', 'id')], ['emp.name', 'emp.id'])
+            assert False
+        except ValueError:
+            pass
+        emp = jdb.tables['emp']
+        assert hash_join(emp, emp, [('mgr', 'id')], ['name'], ['name']) == [['Ben', 'Ann'], ['Cy', 'Ann']]
+        aggregates = [('count', '*'), ('sum', 'amount'), ('min', 'amount'), ('max', 'amount'), ('avg', 'amount')]
+        assert jdb.group_by('orders', ['user_id'], aggregates) == [[1, 2, 8, 3, 5, 4.0], [2, 1, 7, 7, 7, 7.0], [9, 1, 1, 1, 1, 1.0]]
+        assert jdb.group_by('orders', [], aggregates) == [[4, 16, 1, 7, 4.0]]
+        assert jdb.group_by('orders', [], aggregates, [['amount', '>', 100]]) == [[0, 0, None, None, None]]
+        assert jdb.group_by('orders', ['user_id'], [('count', '*')], [['amount', '>', 100]]) == []
+        assert jdb.group_by('orders', ['user_id'], [('sum', 'amount')], [['amount', '<', 6]]) == [[1, 8], [9, 1]]
+        pdb = InMemDb(storage=storage)
+        for row in page_rows:
+            pdb.insert('t', row)
+        assert sorted(pdb.group_by('t', ['group'], [('count', '*'), ('max', 'score')])) == \
+            sorted([g, sum(r['group'] == g for r in page_rows), max(r['score'] for r in page_rows if r['group'] == g)] for g in 'xyz')
+    print('10 joins and group by passed')
 
-db.insert('users', {'id': 101, 'name': 'Alice'})
-db.insert('users', {'id': 102, 'name': 'Bob'})
-db.insert('users', {'id': 103, 'name': 'Charlie'})
 
-ans = db.query('users', ['id'])
+    print('-'*80)
+    for storage in ('row', 'columnar'):
+        bdb = InMemDb(storage=storage)
+        bdb.insert_many('t', ({'id': i, 'name': f'n{i % 3}'} for i in range(5)), chunk_size=2)
+        bdb.create_index('t', 'id', kind='sorted')
+        bdb.insert_many('t', [(5, 'n2'), {'name': 'solo'}, [7, 'n1']])
+        assert bdb.query('t', ['id', 'name']) == [[i, f'n{i % 3}'] for i in range(6)] + [[0, 'solo'], [7, 'n1']]
+        assert bdb.query_with_where('t', ['id'], [['id', '>', 4]]) == [[5], [7]]  # index maintained by insert_many
+        for bad in ([(1,)], [{'nope': 1}]):
+            try:
+                bdb.insert_many('t', bad)
+                assert False
+            except (ValueError, KeyError):
+                pass
+        if storage == 'columnar':
+            bdb.insert_many('t', [(2.5, 'x')])
+            assert type(bdb.tables['t'].columns[0]).__name__ == 'ObjectColumn'
 
-print('1. Naive insert + query\n   ', ans)
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_path = os.path.join(tmp, 'people.csv')
+            with open(csv_path, 'w', newline='') as f:
+                f.write('id,name,score,zip\n1,Ann,2.5,02134\n2,Ben,3,10001\n')
+            bdb.load_csv('people', csv_path, converters={'zip': str}, chunk_size=1)
+            assert bdb.query('people', ['id', 'name', 'score', 'zip']) == [[1, 'Ann', 2.5, '02134'], [2, 'Ben', 3, '10001']]
+            jsonl_path = os.path.join(tmp, 'events.jsonl')
+            with open(jsonl_path, 'w') as f:
+                f.write('{"kind": "click", "n": 1}\n\n{"kind": "view", "n": 2}\n')
+            bdb.load_jsonl('events', jsonl_path)
+            assert bdb.query('events', ['kind', 'n']) == [['click', 1], ['view', 2]]
+    print('11 bulk insert and loaders passed')
 
 
-print('-'*80)
-ans = db.query_with_where('users', ['name'], [['id', '=', 102]])
-print('2.a where\n   ', ans)
+    print('-'*80)
+    for storage in ('row', 'columnar'):
+        sdb = InMemDb(storage=storage)
+        sdb.insert_many('users', [(101, 'Alice', 3), (102, "O'Brien", 2.5), (103, 'Charlie', 1), (104, 'Bob', 4)],
+                        columns=['id', 'name', 'score'])
+        assert sdb.execute('SELECT * FROM users WHERE id = 102') == [[102, "O'Brien", 2.5]]
+        assert sdb.execute("select id from users where name = 'O''Brien'") == [[102]]
+        assert sdb.execute('SELECT name FROM users WHERE id > ? AND score < ? ORDER BY name DESC', [101, 4]) == \
+            [["O'Brien"], ['Charlie']]
+        assert sdb.execute('SELECT id, name FROM users ORDER BY score, id LIMIT 2 OFFSET 1;') == [[102, "O'Brien"], [101, 'Alice']]
+        assert sdb.execute('SELECT id FROM users WHERE score > -1.5 LIMIT 1') == [[101]]
+    for bad in ('SELECT FROM users', 'SELECT id FROM users WHERE id != 1', 'SELECT id FROM users ORDER BY id ASC, name DESC',
+                'SELECT id FROM users LIMIT -1', 'SELECT id FROM users extra', "SELECT id FROM users WHERE name = 'open"):
+        try:
+            parse_sql(bad)
+            assert False, bad
+        except SQLSyntaxError:
+            pass
+    plan = parse_sql('SELECT name FROM users WHERE id > ? ORDER BY name DESC LIMIT 10')
+    assert parse_sql('SELECT name FROM users WHERE id > ? ORDER BY name DESC LIMIT 10') is plan  # cached by text
+    assert (plan.table, plan.columns, plan.order_by, plan.reverse, plan.limit) == ('users', ('name',), ('name',), True, 10)
+    print('12 sql parser passed')
 
-ans = db.query_with_where('users', ['name'], [['id', '>', 102]])
-print('2.b where\n   ', ans)
 
-ans = db.query_with_where('users', ['name'], [['id', '<', 102]])
-print('2.c where\n   ', ans)
+    print('-'*80)
+    for storage in ('row', 'columnar'):
+        mdb = InMemDb(storage=storage)
+        mdb.insert_many('events', [(0, 0, 'start')], columns=['batch', 'value', 'tag'])
+        mdb.create_index('events', 'batch', kind='sorted')
+        mdb.create_index('events', 'tag', kind='hash')
+        mdb.insert_many('labels', [(0, 'zero')], columns=['batch', 'label'])
+        snap = mdb.snapshot()
+        stop_writing = threading.Event()
+        torn = []
 
+        def writer():
+            for batch in range(1, 300):
+                # Every batch holds 10 rows; 'value' widens from int to float half way through.
+                value = batch if batch < 150 else batch + 0.5
+                mdb.insert_many('events', [(batch, value, 'b%d' % (batch % 3))] * 10)
+            stop_writing.set()
 
-print('-'*80)
-ans = db.query_with_order_by('users', ['name'], order_by_columns=['name'], reverse=False)
-print('3.a order by', ans)
-ans = db.query_with_order_by('users', ['name'], order_by_columns=['name'], reverse=True)
-print('3.b order by', ans)
+        def reader():
+            while not stop_writing.is_set():
+                view = mdb.snapshot()
+                count, total = view.group_by('events', [], [('count', '*'), ('sum', 'batch')])[0]
+                if (count - 1) % 10:
+                    torn.append(count)
+                rows = view.query_king('events', ['batch'], [['batch', '>', 0]])
+                if len(rows) != count - 1 or sum(r[0] for r in rows) != total:
+                    torn.append((len(rows), count))
+                indexed = view.execute("SELECT batch FROM events WHERE tag = 'b1'")
+                if len(indexed) % 10:
+                    torn.append(len(indexed))
 
+        threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not torn, torn[:5]
+        assert len(mdb.query('events', ['batch'])) == 1 + 299 * 10
+        # The snapshot taken before the writes still sees exactly one row, through every read path.
+        assert snap.query_king('events', ['batch', 'tag']) == [[0, 'start']]
+        assert snap.execute('SELECT tag FROM events WHERE batch < 1000') == [['start']]
+        assert snap.query_king('events', ['batch'], order_by=['batch'], reverse=True, limit=3) == [[0]]
+        assert snap.group_by('events', ['tag'], [('count', '*')]) == [['start', 1]]
+        assert list(snap.cursor('events', ['value'])) == [[0]]
+        mdb.insert_many('labels', [(n, 'more') for n in range(5)])
+        assert snap.join('events', 'labels', [('batch', 'batch')], ['labels.label', 'events.tag']) == [['zero', 'start']]
+    print('13 mvcc snapshots passed')
 
 
+    print('-'*80)
+    with tempfile.TemporaryDirectory() as tmp:
+        for storage in ('row', 'columnar'):
+            pdb = InMemDb(storage=storage)
+            pdb.insert_many('big', ((i, f'name{i % 50}', i * 0.25, (i, 'x') if i % 2 else None) for i in range(20000)),
+                            columns=['id', 'name', 'score', 'blob'])
+            pdb.insert_many('empty', [], columns=['a'])
+            pdb.insert('wide', {'n': 1})
+            pdb.insert('wide', {'n': 'one'})
+            pdb.insert_many('mixed', [(3,), (2.5,), (True,), (2**70,)], columns=['x'])
+            expected = pdb.query_king('big', ['id', 'name', 'score', 'blob'], [['name', '=', 'name7']], ['score'], True, 10)
+            pdb.save(os.path.join(tmp, storage))
+            pdb.insert('big', {'id': -1})  # after the save: not in the files
 
-print('-'*80)
-ans = db.query_king('users', ['name'], conditions=[['id', '<', 103]], order_by=['name'], reverse=True)
-print('4 where and order by', ans)
+            for load_storage in ('row', 'columnar'):
+                ldb = InMemDb(storage=load_storage)
+                ldb.load(os.path.join(tmp, storage))
+                big = ldb.tables['big']
+                assert len(big.query_raw(['id'])) == 20000
+                assert ldb.query_king('big', ['id', 'name', 'score', 'blob'], [['name', '=', 'name7']], ['score'], True, 10) == expected
+                assert ldb.execute('SELECT id FROM big WHERE score > 4999.5') == [[19999]]
+                assert ldb.query('wide', ['n']) == [[1], ['one']]
+                # Values keep the Python type they were inserted with (3 == 3.0 == True hides this).
+                assert [(x, type(x)) for [x] in ldb.query('mixed', ['x'])] == \
+                    [(3, int), (2.5, float), (True, bool), (2**70, int)]
+                if load_storage == 'columnar':
+                    assert [column.mapped for column in big.columns] == [True, True, True, False]
+                    big.insert({'id': 20000, 'name': 'new', 'score': 1.5})  # copy on write
+                    assert not big.columns[0].mapped and big.columns[2].mapped is False
+                    assert ldb.query_with_where('big', ['name'], [['id', '=', 20000]]) == [['new']]
+            assert len(load_table(os.path.join(tmp, storage, 'big'))) == 20000  # files unchanged
 
+        # Saving a loaded, memory-mapped database back to its own directory.
+        ldb = InMemDb(storage='columnar')
+        ldb.load(os.path.join(tmp, 'columnar'))
+        ldb.insert('wide', {'n': 2})
+        ldb.save(os.path.join(tmp, 'columnar'))
+        assert ldb.execute('SELECT id FROM big WHERE score > 4999.5') == [[19999]]
+        assert sorted(os.listdir(os.path.join(tmp, 'columnar', 'big'))) == \
+            ['0.g2.int64', '1.g2.codes', '1.g2.dict.json', '2.g2.float64', '3.g2.pickle', 'meta.json']
+        reopened = InMemDb(storage='columnar')
+        reopened.load(os.path.join(tmp, 'columnar'))
+        assert reopened.query('wide', ['n']) == [[1], ['one'], [2]]
+        assert reopened.query_king('big', ['id'], order_by=['id'], reverse=True, limit=1) == [[19999]]
+    print('14 persistence passed')
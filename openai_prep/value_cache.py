@@ -0,0 +1,359 @@
+import functools
+import sys
+from collections import OrderedDict
+
+from lru_cache2 import BucketFrequencyCache, CountMinSketch
+
+"""
+A value-carrying cache with a byte budget, built on the frequency structures in
+lru_cache2.py. Meant to sit in front of expensive loaders (dataset parsing,
+equity simulations) via get_or_load() or the memoize() decorator:
+
+    cache = ValueCache(max_bytes=256 * 1024 * 1024, policy="tinylfu")
+
+    @cache.memoize
+    def load_subject(subject_name): ...
+
+Policies decide which entries to keep and track their sizes; ValueCache holds
+the values and the statistics.
+- "lru":     evict the least recently used entries.
+- "lfu":     evict the least frequently used entries (oldest first on ties),
+             with O(log n) updates from BucketFrequencyCache.
+- "tinylfu": W-TinyLFU. New entries land in a small LRU window; an entry
+             leaving the window only enters the main LRU if a CountMinSketch of
+             recent requests says it is more popular than what it would evict.
+             One-off scans therefore cannot flush the hot set.
+"""
+
+
+def deep_sizeof(obj, _seen=None) -> int:
+    """Approximate memory footprint of `obj` including nested containers."""
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, _seen) + deep_sizeof(v, _seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(v, _seen) for v in obj)
+    return size
+
+
+class LRUPolicy:
+    """Evicts the least recently used entries first."""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.used = 0
+        self.sizes = OrderedDict()  # key -> size, oldest first
+
+    def access(self, key):
+        self.sizes.move_to_end(key)
+
+    def miss(self, key):
+        pass
+
+    def insert(self, key, size) -> list:
+        """Adds `key` and returns the keys evicted to make room for it."""
+        evicted = []
+        while self.used + size > self.max_bytes and self.sizes:
+            old_key, old_size = self.sizes.popitem(last=False)
+            self.used -= old_size
+            evicted.append(old_key)
+        self.sizes[key] = size
+        self.used += size
+        return evicted
+
+    def remove(self, key):
+        size = self.sizes.pop(key, None)
+        if size is not None:
+            self.used -= size
+
+
+class LFUPolicy:
+    """
+    Evicts the least frequently used entries first, oldest first among equals.
+    Entries are tracked in a BucketFrequencyCache under their insertion
+    sequence number, so cache keys do not need to be orderable and ties break
+    by age.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.used = 0
+        self.sizes = {}
+        self.ids = {}   # key -> insertion sequence number
+        self.keys = {}  # insertion sequence number -> key
+        self.frequencies = BucketFrequencyCache()
+        self.next_id = 0
+
+    def access(self, key):
+        self.frequencies.addKey(self.ids[key])
+
+    def miss(self, key):
+        pass
+
+    def insert(self, key, size) -> list:
+        evicted = []
+        while self.used + size > self.max_bytes and self.sizes:
+            victim = self.keys[self.frequencies.getMinFrequencyKey()]
+            self.remove(victim)
+            evicted.append(victim)
+        self.ids[key] = self.next_id
+        self.keys[self.next_id] = key
+        self.frequencies.addKey(self.next_id)
+        self.next_id += 1
+        self.sizes[key] = size
+        self.used += size
+        return evicted
+
+    def remove(self, key):
+        entry_id = self.ids.pop(key, None)
+        if entry_id is None:
+            return
+        del self.keys[entry_id]
+        self.frequencies.removeKey(entry_id)
+        self.used -= self.sizes.pop(key)
+
+
+class WTinyLFUPolicy:
+    """
+    W-TinyLFU admission in front of an LRU main space (see module docstring).
+    The sketch counts every request, hits and misses, and is halved every
+    `sample_size` requests so that popularity reflects recent traffic.
+    """
+    def __init__(self, max_bytes, window_fraction=0.01, sketch_width=4096, sample_size=None):
+        window_bytes = max(1, int(max_bytes * window_fraction))
+        self.max_bytes = max_bytes
+        self.window = LRUPolicy(window_bytes)
+        self.main = LRUPolicy(max_bytes - window_bytes)
+        self.sketch = CountMinSketch(sketch_width, 4)
+        self.sample_size = sample_size or 10 * sketch_width
+        self.samples = 0
+
+    @property
+    def used(self):
+        return self.window.used + self.main.used
+
+    def _record(self, key):
+        self.sketch.add(key)
+        self.samples += 1
+        if self.samples >= self.sample_size:
+            self.sketch.halve()
+            self.samples //= 2
+
+    def access(self, key):
+        self._record(key)
+        if key in self.window.sizes:
+            self.window.access(key)
+        else:
+            self.main.access(key)
+
+    def miss(self, key):
+        self._record(key)
+
+    def _admit(self, candidate, size) -> bool:
+        """True if `candidate` is more popular than every main entry it would displace."""
+        main = self.main
+        free = main.max_bytes - main.used
+        if size <= free:
+            return True
+        if size > main.max_bytes:
+            return False
+        frequency = self.sketch.estimate(candidate)
+        for victim, victim_size in main.sizes.items():
+            if self.sketch.estimate(victim) >= frequency:
+                return False
+            free += victim_size
+            if free >= size:
+                return True
+        return False
+
+    def insert(self, key, size) -> list:
+        evicted = []
+        window = self.window
+        window.sizes[key] = size
+        window.used += size
+        while window.used > window.max_bytes:
+            candidate, candidate_size = window.sizes.popitem(last=False)
+            window.used -= candidate_size
+            if self._admit(candidate, candidate_size):
+                evicted += self.main.insert(candidate, candidate_size)
+            else:
+                evicted.append(candidate)
+        return evicted
+
+    def remove(self, key):
+        if key in self.window.sizes:
+            self.window.remove(key)
+        else:
+            self.main.remove(key)
+
+
+class ValueCache:
+    """
+    A get/put cache bounded by the total size of its values (in bytes, as
+    measured by `sizeof`), with a pluggable eviction policy and statistics.
+    """
+    POLICIES = {"lru": LRUPolicy, "lfu": LFUPolicy, "tinylfu": WTinyLFUPolicy}
+
+    _MISSING = object()
+
+    def __init__(self, max_bytes, policy="lru", sizeof=deep_sizeof):
+        if policy not in self.POLICIES:
+            raise ValueError(f"unknown policy {policy!r}, expected one of {sorted(self.POLICIES)}")
+        self.max_bytes = max_bytes
+        self.policy = self.POLICIES[policy](max_bytes)
+        self.sizeof = sizeof
+        self.values = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejections = 0  # puts that were not kept (too large, or refused by admission)
+
+    def get(self, key, default=None):
+        value = self.values.get(key, self._MISSING)
+        if value is self._MISSING:
+            self.misses += 1
+            self.policy.miss(key)
+            return default
+        self.hits += 1
+        self.policy.access(key)
+        return value
+
+    def put(self, key, value, size=None) -> bool:
+        """Stores `value`. Returns False if the policy did not keep it."""
+        if size is None:
+            size = self.sizeof(value)
+        if key in self.values:
+            self.delete(key)
+        if size > self.max_bytes:
+            self.rejections += 1
+            return False
+
+        self.values[key] = value
+        kept = True
+        for evicted in self.policy.insert(key, size):
+            del self.values[evicted]
+            if evicted == key:
+                kept = False
+                self.rejections += 1
+            else:
+                self.evictions += 1
+        return kept
+
+    def delete(self, key) -> bool:
+        if key not in self.values:
+            return False
+        del self.values[key]
+        self.policy.remove(key)
+        return True
+
+    def get_or_load(self, key, loader):
+        """Returns the cached value for `key`, calling loader() and caching its result on a miss."""
+        value = self.get(key, self._MISSING)
+        if value is self._MISSING:
+            value = loader()
+            self.put(key, value)
+        return value
+
+    def memoize(self, func):
+        """Decorator caching func's results by its (hashable) arguments."""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (func.__qualname__, args, tuple(sorted(kwargs.items())))
+            return self.get_or_load(key, lambda: func(*args, **kwargs))
+        return wrapper
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "rejections": self.rejections,
+            "entries": len(self.values),
+            "bytes_used": self.policy.used,
+            "max_bytes": self.max_bytes,
+        }
+
+    def __contains__(self, key):
+        return key in self.values
+
+    def __len__(self):
+        return len(self.values)
+
+
+if __name__ == "__main__":
+    print("--- LRU ---")
+    cache = ValueCache(max_bytes=30, policy="lru", sizeof=len)
+    cache.put("a", "x" * 10)
+    cache.put("b", "x" * 10)
+    cache.put("c", "x" * 10)
+    assert cache.get("a") == "x" * 10  # a is now the most recent
+    cache.put("d", "x" * 10)           # evicts b
+    assert "b" not in cache and "a" in cache
+    assert cache.put("huge", "x" * 31) is False
+    stats = cache.stats()
+    assert stats["bytes_used"] == 30 and stats["evictions"] == 1 and stats["rejections"] == 1
+    print("LRU Passed!")
+
+    print("--- LFU ---")
+    cache = ValueCache(max_bytes=3, policy="lfu", sizeof=lambda v: 1)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.put("c", 3)
+    cache.get("a")
+    cache.get("a")
+    cache.get("c")
+    cache.put("d", 4)  # b is the least frequently used
+    assert "b" not in cache
+    cache.put("e", 5)  # d (count 1) goes before c (count 2)
+    assert "d" not in cache and set(cache.values) == {"a", "c", "e"}
+    cache.put(("tuple", 1), 6)  # keys need not be orderable against each other
+    assert ("tuple", 1) in cache
+    # Churning many one-off entries through a small cache keeps the policy's
+    # bookkeeping proportional to what the cache holds, not to what it has seen.
+    churn = ValueCache(max_bytes=100, policy="lfu", sizeof=lambda v: 1)
+    for i in range(20000):
+        churn.put(i, i)
+    frequencies = churn.policy.frequencies
+    assert len(churn.values) == 100 and len(frequencies.buckets) == 100
+    bucket = frequencies.head
+    while bucket:
+        assert max(len(bucket.low), len(bucket.high)) <= 2 * len(bucket.members) + 9
+        bucket = bucket.next
+    print("LFU Passed!")
+
+    print("--- W-TinyLFU is scan resistant ---")
+    results = {}
+    for policy in ("lru", "tinylfu"):
+        cache = ValueCache(max_bytes=100, policy=policy, sizeof=lambda v: 1)
+        hot = [f"hot{i}" for i in range(50)]
+        for _ in range(20):
+            for key in hot:
+                cache.get_or_load(key, lambda: 0)
+        for i in range(1000):  # one-hit wonders
+            cache.get_or_load(f"scan{i}", lambda: 0)
+        results[policy] = sum(key in cache for key in hot)
+        assert cache.stats()["bytes_used"] <= 100
+    assert results["lru"] == 0
+    assert results["tinylfu"] == 50, results
+    print("W-TinyLFU Passed!")
+
+    print("--- memoize ---")
+    calls = []
+    cache = ValueCache(max_bytes=1 << 20)
+
+    @cache.memoize
+    def load(name, scale=1):
+        calls.append(name)
+        return [name] * scale
+
+    assert load("x", scale=2) == ["x", "x"]
+    assert load("x", scale=2) == ["x", "x"]
+    assert load("y") == ["y"]
+    assert calls == ["x", "y"]
+    assert cache.stats()["hits"] == 1
+    print("memoize Passed!")